@@ -0,0 +1,120 @@
+import os
+import math
+import time
+import threading
+from collections import OrderedDict
+
+# Each client may burst up to RATE_LIMIT_PAGES pages of new PDFs, refilled at RATE_LIMIT_PAGES_PER_MINUTE
+RATE_LIMIT_PAGES = float(os.environ.get('RATE_LIMIT_PAGES', 300))
+RATE_LIMIT_PAGES_PER_MINUTE = float(os.environ.get('RATE_LIMIT_PAGES_PER_MINUTE', 100))
+MAX_TRACKED_CLIENTS = 10_000
+
+# API keys that get a budget of their own (comma-separated); any other key is ignored
+API_KEYS = frozenset(key.strip() for key in os.environ.get('RATE_LIMIT_API_KEYS', '').split(',') if key.strip())
+
+
+class TokenBucket:
+    def __init__(self, capacity, rate, now=None):
+        self.capacity = capacity
+        self.rate = rate  # tokens per second
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost):
+        """Seconds until cost tokens are available"""
+        missing = cost - self.tokens
+        return missing / self.rate if missing > 0 else 0.0
+
+
+class RateLimiter:
+    """Token bucket per client, where a request costs as many tokens as it has pages
+
+    Requests dearer than a full bucket are charged a full bucket, so a client
+    can still upload one document larger than the burst after waiting for it
+    to refill. Only the most recently seen clients are tracked; an evicted
+    client simply starts again with a full bucket.
+
+    Given a store (QuizStore), the buckets are kept in its database instead
+    of in memory, so every server worker charges the same budget. Buckets
+    idle long enough to have refilled are deleted there instead of evicted.
+    """
+
+    def __init__(self, capacity=RATE_LIMIT_PAGES, per_minute=RATE_LIMIT_PAGES_PER_MINUTE,
+                 max_clients=MAX_TRACKED_CLIENTS, store=None):
+        self.capacity = capacity
+        self.rate = per_minute / 60
+        self.max_clients = max_clients
+        self.store = store
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.capacity > 0 and self.rate > 0
+
+    def _bucket(self, client):
+        bucket = self.buckets.get(client)
+        if bucket is None:
+            bucket = self.buckets[client] = TokenBucket(self.capacity, self.rate)
+            if len(self.buckets) > self.max_clients:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(client)
+        bucket.refill(time.monotonic())
+        return bucket
+
+    def _with_bucket(self, client, action):
+        """Run action on the client's bucket, refilled up to now, and return its result"""
+        if self.store is None:
+            with self.lock:
+                return action(self._bucket(client))
+
+        def update(saved):
+            # Wall-clock time, since the buckets are shared between processes
+            now = time.time()
+            bucket = TokenBucket(self.capacity, self.rate, now)
+            if saved is not None:
+                bucket.tokens, bucket.updated = saved
+                bucket.refill(now)
+            result = action(bucket)
+            return (bucket.tokens, bucket.updated), result
+        return self.store.update_bucket(client, update)
+
+    def retry_after(self, client, cost=1):
+        """Seconds the client has to wait before a request of this cost would be admitted, 0 if none"""
+        if not self.enabled:
+            return 0
+        cost = min(cost, self.capacity)
+        return self._with_bucket(client, lambda bucket: math.ceil(bucket.wait_time(cost)))
+
+    def take(self, client, cost=1):
+        """Charge cost tokens to client; returns 0 on success, or the seconds to wait before retrying"""
+        if not self.enabled:
+            return 0
+        cost = min(cost, self.capacity)
+
+        def charge(bucket):
+            wait = bucket.wait_time(cost)
+            if wait > 0:
+                return math.ceil(wait)
+            bucket.tokens -= cost
+            return 0
+
+        retry_after = self._with_bucket(client, charge)
+        if self.store is not None:
+            self.store.prune_buckets(time.time() - self.capacity / self.rate)
+        return retry_after
+
+    def refund(self, client, cost=1):
+        """Give back tokens for a request that was charged but then not run"""
+        if not self.enabled:
+            return
+        cost = min(cost, self.capacity)
+
+        def give_back(bucket):
+            bucket.tokens = min(self.capacity, bucket.tokens + cost)
+        self._with_bucket(client, give_back)
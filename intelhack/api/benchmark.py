@@ -0,0 +1,368 @@
+import io
+import os
+import sys
+import json
+import time
+import hashlib
+import types
+import shutil
+import filecmp
+import argparse
+import resource
+import tempfile
+import platform
+import contextlib
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from pdf_text import iter_pages # pdf extraction stage
+from textChunk import iter_chunks, iter_token_chunks # normalize_text/chunk_text stage
+from quizGeneration import RobustQuizGenerator, save_output # generation and golden outputs
+from quizExport import QuizWriter, EXPORT_FORMATS, FILE_NAMES # serialization stage
+from quizDedupe import QuestionDeduper, DEDUPE_THRESHOLD # optional dedupe pass
+from pipeline import stream_quiz, load_memo, save_memo # incremental re-runs
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.abspath(os.path.join(API_DIR, '../..'))
+UPLOADS_DIR = os.path.join(API_DIR, 'uploads')
+
+# Bundled corpora; golden_* files are the known-good outputs each stage must reproduce
+CORPORA = [
+    {
+        'name': 'bionotes',
+        'pdf': os.path.join(UPLOADS_DIR, 'bionotes.pdf'),
+        'golden_text': os.path.join(UPLOADS_DIR, 'bionotes.txt'),
+    },
+    {
+        'name': 'tesp65',
+        'pdf': os.path.join(UPLOADS_DIR, '___TESP65-SPRING-25.pdf'),
+    },
+    {
+        'name': 'week7',
+        'pdf': os.path.join(UPLOADS_DIR, 'Week7_complex numbers_posted version.pdf'),
+        'golden_text': os.path.join(UPLOADS_DIR, 'Week7_complex numbers_posted version.txt'),
+        'golden_chunks': os.path.join(UPLOADS_DIR, 'Week7_complex numbers_posted version_chunks.txt'),
+        'golden_json': os.path.join(UPLOADS_DIR, 'Week7_complex numbers_posted version_quiz.json'),
+        'golden_csv': os.path.join(UPLOADS_DIR, 'Week7_complex numbers_posted version_quiz.csv'),
+    },
+    {
+        'name': 'dsa',
+        'text': os.path.join(UPLOADS_DIR, 'dsa.txt'),
+        'golden_chunks': os.path.join(UPLOADS_DIR, 'dsa_chunks.txt'),
+        'golden_json': os.path.join(UPLOADS_DIR, 'dsa_quiz.json'),
+        'golden_csv': os.path.join(UPLOADS_DIR, 'dsa_quiz.csv'),
+    },
+    {
+        'name': 'chunk',
+        'chunks': os.path.join(REPO_DIR, 'chunk.txt'),
+        'golden_json': os.path.join(REPO_DIR, 'quiz_data.json'),
+        'golden_csv': os.path.join(REPO_DIR, 'quiz_output.csv'),
+    },
+]
+
+# Metrics where a higher number is better; everything else is a time or size
+HIGHER_IS_BETTER = ('pages_per_sec', 'chunks_per_sec')
+
+
+def load_generator_from_git(rev):
+    """Load RobustQuizGenerator as it was at a git revision, for before/after comparisons"""
+    source = subprocess.run(
+        ['git', 'show', f'{rev}:./quizGeneration.py'],
+        cwd=API_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    module = types.ModuleType(f'quizGeneration_{rev}')
+    exec(compile(source, f'{rev}:quizGeneration.py', 'exec'), module.__dict__)
+    return module.RobustQuizGenerator
+
+
+def time_best(func, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def same_file(path, golden):
+    return filecmp.cmp(path, golden, shallow=False)
+
+
+def digest(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def in_fresh_process(func, *args):
+    """Run func in a new interpreter, so it has its own peak RSS and hash seed"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(func, *args).result()
+
+
+def variant_digests(corpus):
+    """Digests of what the non-default engines make of a corpus, to check they give the same output every run"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        if 'pdf' in corpus or 'text' in corpus:
+            if 'pdf' in corpus:
+                pages = list(iter_pages(corpus['pdf']))
+            else:
+                with open(corpus['text'], 'r') as f:
+                    pages = [f.read()]
+            chunks = list(iter_chunks(pages))
+            outputs = {
+                'tokens': list(iter_token_chunks(pages)),
+                'tfidf': list(RobustQuizGenerator(term_scoring='tfidf').process_chunks(chunks)),
+            }
+            quiz_data = list(RobustQuizGenerator().process_chunks(chunks))
+        else:
+            with open(corpus['chunks'], 'r', encoding='utf-8') as f:
+                full_text = f.read()
+            outputs = {'tfidf': RobustQuizGenerator(term_scoring='tfidf').process_text(full_text)}
+            quiz_data = RobustQuizGenerator().process_text(full_text)
+        outputs['dedupe'] = list(QuestionDeduper(DEDUPE_THRESHOLD).dedupe(quiz_data))
+    return {name: digest(output) for name, output in outputs.items()}
+
+
+def check_memo(corpus, workdir):
+    """Failures if re-running a PDF from its saved memo gives other records than a full rebuild"""
+    memo_path = os.path.join(workdir, f"{corpus['name']}_memo.json")
+    full = list(stream_quiz(corpus['pdf']))
+    for chunker in ('words', 'tokens'):
+        memo = load_memo(memo_path, chunker=chunker)
+        first = list(stream_quiz(corpus['pdf'], chunker=chunker, memo=memo))
+        save_memo(memo_path, memo, chunker=chunker)
+        rerun = list(stream_quiz(corpus['pdf'], chunker=chunker, memo=load_memo(memo_path, chunker=chunker)))
+        rebuild = full if chunker == 'words' else list(stream_quiz(corpus['pdf'], chunker=chunker))
+        if not first == rerun == rebuild:
+            return [f"{corpus['name']}: {chunker} output from the memo differs from a full rebuild"]
+    return []
+
+
+def bench_corpus(corpus, repeat, workdir):
+    """Time each pipeline stage on one corpus and check its output against the golden files"""
+    stats = {}
+    failures = []
+    quiet = contextlib.redirect_stdout(io.StringIO())
+
+    def check(kind, produced):
+        golden = corpus.get(f'golden_{kind}')
+        if golden and not same_file(produced, golden):
+            failures.append(f"{corpus['name']}: {kind} output differs from {os.path.relpath(golden, REPO_DIR)}")
+
+    # Stage 1: PDF extraction
+    if 'pdf' in corpus:
+        elapsed, pages = time_best(lambda: list(iter_pages(corpus['pdf'])), repeat)
+        stats['extract'] = {'seconds': elapsed, 'pages': len(pages), 'pages_per_sec': len(pages) / elapsed}
+        text_path = os.path.join(workdir, f"{corpus['name']}.txt")
+        with open(text_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(pages))
+        check('text', text_path)
+    elif 'text' in corpus:
+        with open(corpus['text'], 'r') as f:
+            pages = [f.read()]
+    else:
+        pages = None
+
+    # Stage 2: remove_sections/normalize_text/chunk_text
+    if pages is not None:
+        elapsed, chunks = time_best(lambda: list(iter_chunks(pages)), repeat)
+        stats['chunk'] = {'seconds': elapsed, 'chunks': len(chunks), 'chunks_per_sec': len(chunks) / elapsed}
+        chunks_path = os.path.join(workdir, f"{corpus['name']}_chunks.txt")
+        with open(chunks_path, 'w') as f:
+            for i, chunk in enumerate(chunks):
+                f.write(f"\n--- Chunk {i + 1} ---\n")
+                f.write(chunk + '\n')
+        check('chunks', chunks_path)
+
+        generate = lambda: list(RobustQuizGenerator().process_chunks(chunks))
+    else:
+        with open(corpus['chunks'], 'r', encoding='utf-8') as f:
+            full_text = f.read()
+        chunks = [piece for piece in full_text.split('\n\n') if piece.strip()]
+
+        generate = lambda: RobustQuizGenerator().process_text(full_text)
+
+    # Stage 3: question generation
+    elapsed, quiz_data = time_best(generate, repeat)
+    stats['generate'] = {
+        'seconds': elapsed,
+        'chunks': len(chunks),
+        'chunks_per_sec': len(chunks) / elapsed,
+        'questions': sum(len(chunk['questions']) for chunk in quiz_data),
+    }
+
+    # Stage 4: serialization, through the QuizWriter and formats the upload pipeline uses
+    paths = {name: os.path.join(workdir, f"{corpus['name']}_{FILE_NAMES[name]}")
+             for name in dict.fromkeys(('json', 'csv', 'jsonl', *EXPORT_FORMATS))}
+
+    def serialize():
+        with QuizWriter(paths) as writer:
+            for record in quiz_data:
+                writer.write(record)
+
+    elapsed, _ = time_best(serialize, repeat)
+    stats['serialize'] = {'seconds': elapsed, 'bytes': sum(os.path.getsize(path) for path in paths.values())}
+
+    # The golden files hold save_output's formatting, which the command-line entry points still write
+    json_path = os.path.join(workdir, f"{corpus['name']}_golden_quiz.json")
+    csv_path = os.path.join(workdir, f"{corpus['name']}_golden_quiz.csv")
+    with quiet:
+        save_output(quiz_data, json_path, 'json')
+        save_output(quiz_data, csv_path, 'csv')
+    check('json', json_path)
+    check('csv', csv_path)
+
+    if 'pdf' in corpus:
+        with quiet:
+            failures.extend(check_memo(corpus, workdir))
+
+    stats['peak_rss_mb'] = peak_rss_mb()
+    return stats, failures, variant_digests(corpus)
+
+
+def bench_upload(corpora, workdir):
+    """Time /api/upload end to end through the Flask test client, cold and then cached"""
+    # server.py keeps its uploads relative to the working directory
+    previous_dir = os.getcwd()
+    os.chdir(workdir)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            import server
+        client = server.app.test_client()
+
+        def upload(path):
+            start = time.perf_counter()
+            with open(path, 'rb') as f:
+                response = client.post('/api/upload', data={'pdf': (f, os.path.basename(path))})
+            status_url = response.get_json()['status_url']
+            while True:
+                job = client.get(status_url).get_json()
+                if job['status'] in ('done', 'failed'):
+                    break
+                time.sleep(0.01)
+            return time.perf_counter() - start, job['status']
+
+        results = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            for corpus in corpora:
+                if 'pdf' not in corpus:
+                    continue
+                cold, status = upload(corpus['pdf'])
+                cached, _ = upload(corpus['pdf'])
+                results[corpus['name']] = {'cold_seconds': cold, 'cached_seconds': cached, 'status': status}
+        server.jobs.shutdown()
+        return results
+    finally:
+        os.chdir(previous_dir)
+
+
+def compare_to_baseline(report, baseline, tolerance):
+    """Return a list of metrics that got worse than the baseline by more than tolerance"""
+    regressions = []
+    for corpus, stages in baseline.get('corpora', {}).items():
+        for stage, metrics in stages.items():
+            if not isinstance(metrics, dict):
+                continue
+            current = report['corpora'].get(corpus, {}).get(stage, {})
+            for metric in ('seconds', 'pages_per_sec', 'chunks_per_sec'):
+                if metric not in metrics or metric not in current:
+                    continue
+                old, new = metrics[metric], current[metric]
+                worse = new < old * (1 - tolerance) if metric in HIGHER_IS_BETTER else new > old * (1 + tolerance)
+                if worse:
+                    regressions.append(f"{corpus}.{stage}.{metric}: {old:.4g} -> {new:.4g}")
+    return regressions
+
+
+def print_report(report):
+    for name, stats in report['corpora'].items():
+        parts = []
+        for stage in ('extract', 'chunk', 'generate', 'serialize'):
+            if stage not in stats:
+                continue
+            stage_stats = stats[stage]
+            part = f"{stage} {stage_stats['seconds'] * 1000:.1f} ms"
+            if 'pages_per_sec' in stage_stats:
+                part += f" ({stage_stats['pages_per_sec']:.0f} pages/s)"
+            elif 'chunks_per_sec' in stage_stats:
+                part += f" ({stage_stats['chunks_per_sec']:.0f} chunks/s)"
+            parts.append(part)
+        print(f"{name}: " + ", ".join(parts) + f", peak RSS {stats['peak_rss_mb']:.0f} MB")
+
+    for name, stats in report.get('upload', {}).items():
+        print(f"upload {name}: cold {stats['cold_seconds'] * 1000:.0f} ms, "
+              f"cached {stats['cached_seconds'] * 1000:.1f} ms ({stats['status']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the quiz pipeline on the bundled corpora')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per stage, best time is reported')
+    parser.add_argument('--corpus', action='append', help='only run these corpora (by name)')
+    parser.add_argument('--skip-upload', action='store_true', help='skip the end-to-end /api/upload timing')
+    parser.add_argument('--save', metavar='PATH', help='write the results to a baseline JSON file')
+    parser.add_argument('--baseline', metavar='PATH', help='compare against a saved baseline JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown against the baseline')
+    parser.add_argument('--compare', metavar='REV', help='only time the generator against this git revision')
+    args = parser.parse_args()
+
+    corpora = [c for c in CORPORA if not args.corpus or c['name'] in args.corpus]
+
+    if args.compare:
+        baseline_cls = load_generator_from_git(args.compare)
+        for corpus in corpora:
+            if 'chunks' not in corpus:
+                continue
+            with open(corpus['chunks'], 'r', encoding='utf-8') as f:
+                full_text = f.read()
+            elapsed, quiz_data = time_best(lambda: RobustQuizGenerator().process_text(full_text), args.repeat)
+            base_elapsed, base_data = time_best(lambda: baseline_cls().process_text(full_text), args.repeat)
+            same = 'identical output' if base_data == quiz_data else 'OUTPUT DIFFERS'
+            print(f"{corpus['name']}: {elapsed * 1000:.1f} ms vs {base_elapsed * 1000:.1f} ms at {args.compare} "
+                  f"({base_elapsed / elapsed:.1f}x, {same})")
+        return 0
+
+    report = {'python': platform.python_version(), 'machine': platform.machine(), 'corpora': {}}
+    failures = []
+    workdir = tempfile.mkdtemp(prefix='quiz-bench-')
+    try:
+        for corpus in corpora:
+            # Each corpus runs in a process of its own, so the peak RSS reported is that corpus's
+            stats, corpus_failures, digests = in_fresh_process(bench_corpus, corpus, args.repeat, workdir)
+            report['corpora'][corpus['name']] = stats
+            failures.extend(corpus_failures)
+            # A second process has another hash seed, so set or dict ordering leaking into output shows up
+            rerun = in_fresh_process(variant_digests, corpus)
+            failures.extend(f"{corpus['name']}: {name} output differs between runs"
+                            for name in digests if rerun.get(name) != digests[name])
+        if not args.skip_upload:
+            report['upload'] = bench_upload(corpora, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(report)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare_to_baseline(report, json.load(f), args.tolerance)
+        failures.extend(f"Slower than baseline: {regression}" for regression in regressions)
+
+    for failure in failures:
+        print(f"[!] {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
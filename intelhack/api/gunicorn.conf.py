@@ -0,0 +1,39 @@
+"""gunicorn settings for serving the API and the built React app
+
+    cd intelhack/api && gunicorn -c gunicorn.conf.py 'wsgi:create_app()'
+
+Uploads only hash and spool the PDF; the CPU-heavy pipeline runs in each
+worker's JobQueue process pool. Job status, progress and the upload each
+unfinished job is for are kept in the quiz store, so with WEB_CONCURRENCY > 1
+a status poll can land on any worker and identical uploads to different
+workers still share one job. Upload rate limits (RATE_LIMIT_PAGES,
+RATE_LIMIT_PAGES_PER_MINUTE) are kept there too and apply across workers.
+Each worker runs its own pool and queue, though, so PIPELINE_WORKERS and
+PIPELINE_MAX_PENDING apply per worker: divide them by WEB_CONCURRENCY.
+"""
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:3000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 16))
+
+# Import the app, and PyMuPDF, the generator and any model (see wsgi.warm_up), once in the
+# master so the workers share them copy-on-write
+preload_app = True
+
+# In-flight pipeline jobs get this long to finish on shutdown (SIGTERM) or reload (SIGHUP)
+DRAIN_TIMEOUT = int(os.environ.get('PIPELINE_DRAIN_TIMEOUT', 120))
+graceful_timeout = DRAIN_TIMEOUT + 10
+timeout = 60
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+
+
+def worker_exit(server, worker):
+    from server import jobs
+    abandoned = jobs.drain(timeout=DRAIN_TIMEOUT)
+    if abandoned:
+        server.log.warning(f"Worker {worker.pid} exited with {abandoned} unfinished pipeline jobs")
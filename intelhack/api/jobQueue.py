@@ -0,0 +1,382 @@
+import os
+import math
+import time
+import uuid
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait as wait_for
+
+from pipeline import STAGES, generate_quiz_from_pdf, load_memo, save_memo # streaming pdf -> chunks -> quiz
+from metrics import Counter, Histogram, log_event # pipeline metrics for /api/metrics
+from quizGeneration import QUIZ_BACKEND, TERM_SCORING
+from quizExport import EXPORT_FORMATS, FILE_NAMES
+from textChunk import CHUNKER_ENGINE
+from quizDedupe import DEDUPE, DEDUPE_THRESHOLD
+
+# Pool size defaults to one worker per core; pending jobs beyond the limit are rejected
+MAX_WORKERS = int(os.environ.get('PIPELINE_WORKERS', os.cpu_count() or 2))
+MAX_PENDING_JOBS = int(os.environ.get('PIPELINE_MAX_PENDING', MAX_WORKERS * 4))
+JOB_HISTORY = 200
+
+# An unfinished job older than this no longer holds its upload's key, e.g. after its worker was killed
+JOB_TIMEOUT = int(os.environ.get('PIPELINE_JOB_TIMEOUT', 3600))
+
+# Pool workers write a job's progress to the store, for polls answered by other server workers, at most this often
+PROGRESS_INTERVAL = 0.5
+
+# Split large PDFs across extra processes inside each pipeline worker
+PARALLEL_EXTRACT = os.environ.get('PIPELINE_PARALLEL_EXTRACT', '0') == '1'
+
+# Keep text.txt/chunks.txt next to the quiz in each cache entry for debugging
+KEEP_ARTIFACTS = os.environ.get('PIPELINE_KEEP_ARTIFACTS', '1') == '1'
+
+# Keep per-stage results in memo.json so a re-upload of an edited PDF only redoes what changed
+INCREMENTAL = os.environ.get('PIPELINE_INCREMENTAL', '1') == '1'
+
+
+# Recorded in the server process from the progress each pool worker reports
+STAGE_SECONDS = Histogram('pipeline_stage_seconds', 'Time spent in each pipeline stage per job', ['stage'])
+JOB_SECONDS = Histogram('pipeline_job_seconds', 'Time from submitting a job to its completion, including queueing')
+JOBS = Counter('pipeline_jobs_total', 'Pipeline jobs by outcome', ['outcome'])
+FAILURES = Counter('pipeline_failures_total', 'Failed pipeline jobs by the stage they failed in', ['stage'])
+PAGES = Counter('pipeline_pages_total', 'Pages extracted')
+CHUNKS = Counter('pipeline_chunks_total', 'Chunks produced')
+QUESTIONS = Counter('pipeline_questions_total', 'Questions generated')
+
+
+# Assumed time per job until one has finished and been measured
+DEFAULT_JOB_SECONDS = 10.0
+
+
+class QueueFullError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after  # seconds until a slot is likely free, None when shutting down
+
+
+def run_pipeline(job_id, key, cache, store, filename, progress, previous=None, trace_id=None):
+    """Run extract -> chunk -> generate for one cached upload inside a pool worker
+
+    previous is the cache key of an earlier upload of the same document,
+    whose memo lets unchanged pages, sections and chunks be reused.
+    """
+    output_dir = cache.entry_dir(key)
+    started = time.perf_counter()
+    last_state = {}
+    last_saved = 0.0
+
+    def on_progress(state):
+        nonlocal last_saved
+        last_state.update(state)
+        progress[job_id] = state
+        now = time.monotonic()
+        if now - last_saved >= PROGRESS_INTERVAL:
+            store.save_job_progress(job_id, state)
+            last_saved = now
+
+    memo = None
+    if INCREMENTAL:
+        memo = load_memo(os.path.join(cache.entry_dir(previous), 'memo.json') if previous else '',
+                         backend=QUIZ_BACKEND, chunker=CHUNKER_ENGINE)
+
+    # quiz.json, quiz.csv and quiz.jsonl, which job results read while the job runs, are always
+    # written; anything else is opt-in through QUIZ_EXPORT_FORMATS
+    exports = ['jsonl'] + [name for name in EXPORT_FORMATS if name not in ('json', 'csv', 'jsonl')]
+
+    try:
+        json_output_path = os.path.join(output_dir, 'quiz.json')
+        quiz_data = generate_quiz_from_pdf(
+            os.path.join(output_dir, 'source.pdf'),
+            json_output_path,
+            os.path.join(output_dir, 'quiz.csv'),
+            text_out=os.path.join(output_dir, 'text.txt') if KEEP_ARTIFACTS else None,
+            chunks_out=os.path.join(output_dir, 'chunks.txt') if KEEP_ARTIFACTS else None,
+            parallel=PARALLEL_EXTRACT,
+            backend=QUIZ_BACKEND,
+            chunker=CHUNKER_ENGINE,
+            scoring=TERM_SCORING,
+            dedupe_threshold=DEDUPE_THRESHOLD if DEDUPE else None,
+            memo=memo,
+            on_progress=on_progress,
+            trace_id=trace_id,
+            exports={name: os.path.join(output_dir, FILE_NAMES[name]) for name in exports}
+        )
+        if memo is not None:
+            save_memo(os.path.join(output_dir, 'memo.json'), memo, backend=QUIZ_BACKEND, chunker=CHUNKER_ENGINE)
+    except Exception:
+        cache.discard(key)
+        raise
+
+    # Quizzes are stored under their cache key, so identical uploads share one quiz
+    store.save_quiz(key, filename, quiz_data)
+
+    # Whatever the streaming stages did not account for went into writing the outputs
+    timings = dict(last_state.get('timings', {}))
+    timings['serialize'] = max(time.perf_counter() - started - sum(timings.values()), 0.0)
+    progress[job_id] = dict(last_state, timings=timings)
+    store.save_job_progress(job_id, progress[job_id])
+    log_event('stage', trace_id, stage='serialize', seconds=round(timings['serialize'], 6))
+
+    result = {
+        'quiz_id': key,
+        'quiz_url': cache.url_for(key, 'json'),
+        'quiz_csv': cache.url_for(key, 'csv'),
+        'exports': {name: cache.url_for(key, name) for name in exports},
+        'num_chunks': len(quiz_data),
+        'total_questions': sum(len(chunk["questions"]) for chunk in quiz_data),
+        'duplicates_removed': last_state.get('duplicates', 0)
+    }
+    cache.put(key, result)
+    return result
+
+
+class JobQueue:
+    """Bounded process pool that runs upload pipelines and tracks their progress
+
+    Jobs are tracked in memory and, given a store, written through to it, so
+    that status() also finds jobs accepted by another server worker.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, max_pending=MAX_PENDING_JOBS, store=None):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.store = store
+        self.jobs = {}
+        self.inflight = {}
+        self.futures = {}
+        self.draining = False
+        self.avg_job_seconds = DEFAULT_JOB_SECONDS
+        self.lock = threading.Lock()
+        # The pool and manager are started on first use so importing the server stays cheap
+        self._executor = None
+        self._manager = None
+        self._progress = None
+
+    def _ensure_started(self):
+        if self._executor is None:
+            self._manager = multiprocessing.Manager()
+            self._progress = self._manager.dict()
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+    def pending_count(self):
+        return sum(1 for job in self.jobs.values() if job['status'] in ('queued', 'running'))
+
+    def queue_depth(self):
+        """Jobs submitted but not finished, for the queue depth gauge"""
+        with self.lock:
+            return self.pending_count()
+
+    def _new_job(self, key, filename, status):
+        job_id = uuid.uuid4().hex
+        self.jobs[job_id] = {
+            'id': job_id,
+            'key': key,
+            'filename': filename,
+            'status': status,
+            'created': time.time(),
+            'finished': None,
+            'result': None,
+            'error': None,
+            'trace_id': None,
+        }
+        return self.jobs[job_id]
+
+    def _save(self, job):
+        if self.store is not None:
+            self.store.save_job(job)
+
+    def is_inflight(self, key):
+        with self.lock:
+            if key in self.inflight:
+                return True
+        return self.store is not None and self.store.inflight_job(key) is not None
+
+    def submit(self, key, cache, store, filename=None, previous=None, trace_id=None, prepare=None):
+        """Queue the pipeline for the cache entry key; identical in-flight uploads share one job
+
+        With a store, the key is claimed there, so uploads of the same PDF to
+        different server workers share one job too. prepare, e.g. moving the
+        upload into the cache entry, is only called for a new job, once its
+        key is claimed. previous optionally names the cache entry of an
+        earlier version of the upload.
+        """
+        with self.lock:
+            if key in self.inflight:
+                return self.inflight[key]
+            if self.draining:
+                raise QueueFullError('shutting down')
+            if self.pending_count() >= self.max_pending:
+                # One of the max_workers running jobs frees a slot every avg_job_seconds / max_workers on average
+                retry_after = max(1, math.ceil(self.avg_job_seconds / self.max_workers))
+                raise QueueFullError(f'{self.max_pending} jobs already pending', retry_after=retry_after)
+
+            self._ensure_started()
+            job = self._new_job(key, filename, 'queued')
+            job['trace_id'] = trace_id
+            job_id = job['id']
+            if self.store is not None:
+                # Saved before the job ID is handed out, so a poll on any worker finds it
+                owner = self.store.claim_job(job, stale_after=JOB_TIMEOUT)
+                if owner != job_id:
+                    del self.jobs[job_id]
+                    return owner
+            self.inflight[key] = job_id
+            self._prune()
+            job = dict(job)
+
+        if prepare is not None:
+            try:
+                prepare()
+            except Exception as e:
+                self._abandon(job_id, key, f'could not be queued: {e}')
+                raise
+        log_event('job_queued', trace_id, job_id=job_id, key=key, previous=previous)
+        future = self._executor.submit(run_pipeline, job_id, key, cache, store, filename, self._progress,
+                                       previous, trace_id)
+        with self.lock:
+            self.futures[job_id] = future
+        future.add_done_callback(lambda f: self._finish(job_id, key, f))
+        return job_id
+
+    def _abandon(self, job_id, key, error):
+        with self.lock:
+            self.inflight.pop(key, None)
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            job.update(status='failed', finished=time.time(), error=error)
+            job = dict(job)
+        self._save(job)
+
+    def complete(self, result, filename=None, trace_id=None):
+        """Record an already finished job, e.g. a result served from the cache"""
+        with self.lock:
+            job = self._new_job(result.get('quiz_id'), filename, 'done')
+            job['finished'] = job['created']
+            job['result'] = result
+            job['trace_id'] = trace_id
+            self._prune()
+            job = dict(job)
+        self._save(job)
+        JOBS.inc(outcome='cached')
+        return job['id']
+
+    def _finish(self, job_id, key, future):
+        with self.lock:
+            self.inflight.pop(key, None)
+            self.futures.pop(job_id, None)
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            job['finished'] = time.time()
+            error = future.exception() if not future.cancelled() else 'cancelled on shutdown'
+            if error is not None:
+                job['status'] = 'failed'
+                job['error'] = str(error)
+            else:
+                job['status'] = 'done'
+                job['result'] = future.result()
+            job = dict(job)
+
+        self._save(job)
+        if self.store is not None:
+            self.store.prune_jobs(JOB_HISTORY)
+        self._record(job)
+
+    def _record(self, job):
+        try:
+            state = (self._progress.get(job['id']) if self._progress is not None else None) or {}
+        except (OSError, EOFError):
+            state = {}  # the progress manager is already gone when a drain gave up on this job
+        JOBS.inc(outcome=job['status'])
+        JOB_SECONDS.observe(job['finished'] - job['created'])
+        for stage, seconds in state.get('timings', {}).items():
+            STAGE_SECONDS.observe(seconds, stage=stage)
+        if job['status'] == 'done' and state.get('timings'):
+            with self.lock:
+                # Moving average of the time a job keeps a pool worker busy, for Retry-After estimates
+                self.avg_job_seconds = 0.8 * self.avg_job_seconds + 0.2 * sum(state['timings'].values())
+        PAGES.inc(state.get('pages', 0))
+        CHUNKS.inc(state.get('chunks', 0))
+        QUESTIONS.inc(state.get('questions', 0))
+
+        if job['status'] == 'failed':
+            FAILURES.inc(stage=state.get('stage') or 'queued')
+            log_event('job_failed', job['trace_id'], job_id=job['id'], stage=state.get('stage'), error=job['error'])
+        else:
+            log_event('job_done', job['trace_id'], job_id=job['id'],
+                      seconds=round(job['finished'] - job['created'], 6), timings=state.get('timings'))
+
+    def _prune(self):
+        finished = [job for job in self.jobs.values() if job['finished'] is not None]
+        if len(finished) > JOB_HISTORY:
+            finished.sort(key=lambda job: job['finished'])
+            for job in finished[:len(finished) - JOB_HISTORY]:
+                self.jobs.pop(job['id'], None)
+                if self._progress is not None:
+                    self._progress.pop(job['id'], None)
+
+    def status(self, job_id):
+        """Return a JSON-friendly snapshot of a job, or None if the ID is unknown"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            job = dict(job) if job is not None else None
+
+        if job is not None:
+            state = self._progress.get(job_id) if self._progress is not None else None
+        elif self.store is not None:
+            # Accepted by another server worker; its progress is as recent as PROGRESS_INTERVAL
+            job = self.store.get_job(job_id)
+            if job is None:
+                return None
+            state = job.pop('progress')
+        else:
+            return None
+        if job['status'] == 'queued' and state is not None:
+            job['status'] = 'running'
+        state = state or {}
+        stage = state.get('stage')
+
+        # Stages overlap while streaming, so each one is reported on its own
+        stages = {}
+        for name in STAGES:
+            if job['status'] == 'done' or name in state.get('done', []):
+                stages[name] = 'done'
+            elif stage is not None and STAGES.index(name) <= STAGES.index(stage):
+                stages[name] = 'failed' if job['status'] == 'failed' else 'running'
+            else:
+                stages[name] = 'pending'
+
+        job['stage'] = stage
+        job['stages'] = stages
+        job['progress'] = {name: state.get(name, 0) for name in ('pages', 'chunks', 'questions')}
+        job['timings'] = state.get('timings', {})
+        return job
+
+    def drain(self, timeout=None):
+        """Stop accepting jobs, give queued and running ones up to timeout seconds, then shut down
+
+        Returns the number of jobs that had to be abandoned.
+        """
+        with self.lock:
+            self.draining = True
+            futures = dict(self.futures)
+
+        log_event('drain_started', pending=len(futures), timeout=timeout)
+        _, unfinished = wait_for(futures.values(), timeout=timeout)
+        self.shutdown(wait=not unfinished, cancel_futures=bool(unfinished))
+
+        # Jobs still running are left behind; record them as failed so polls through other workers stop waiting
+        with self.lock:
+            abandoned = [dict(self.jobs[job_id], status='failed', finished=time.time(), error='abandoned on shutdown')
+                         for job_id, future in futures.items() if not future.done() and job_id in self.jobs]
+        for job in abandoned:
+            self._save(job)
+        log_event('drain_finished', abandoned=len(unfinished))
+        return len(unfinished)
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+            self._manager.shutdown()
+            self._executor = None
@@ -1,32 +1,142 @@
 import fitz  # PyMuPDF
 import os
+import mmap
+import hashlib
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 
-def extract_text_and_note_images(pdf_path, output_path):
-    doc = fitz.open(pdf_path)
-    output_lines = []
+# Below this many pages the pool start-up costs more than it saves
+PARALLEL_MIN_PAGES = 16
 
-    for page_num, page in enumerate(doc, start=1):
-        output_lines.append(f"--- Page {page_num} ---")
-        
-        text = page.get_text("text")
-        if text.strip():
-            output_lines.append(text.strip())
-        else:
-            output_lines.append("[No text found]")
+@contextmanager
+def open_pdf(source):
+    """Open a PDF without copying it: files are mmap'd read-only, buffers are used in place"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        with fitz.open(stream=memoryview(source), filetype="pdf") as doc:
+            yield doc
+        return
 
-        # Check for images/diagrams
+    with open(source, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm)
+        try:
+            with fitz.open(stream=view, filetype="pdf") as doc:
+                yield doc
+        finally:
+            view.release()
+
+def page_count(source):
+    """Number of pages, read from the PDF's page tree without parsing any page"""
+    with open_pdf(source) as doc:
+        return doc.page_count
+
+def page_text(page, page_num, include_images=True):
+    lines = [f"--- Page {page_num} ---"]
+
+    text = page.get_text("text")
+    if text.strip():
+        lines.append(text.strip())
+    else:
+        lines.append("[No text found]")
+
+    # Check for images/diagrams
+    if include_images:
         image_list = page.get_images(full=True)
         if image_list:
-            output_lines.append(f"[Note: This page contains {len(image_list)} diagram(s)/image(s)]")
+            lines.append(f"[Note: This page contains {len(image_list)} diagram(s)/image(s)]")
+
+    lines.append("")  # Blank line between pages
+    return "\n".join(lines)
+
+def page_fingerprint(page, include_images=True):
+    """Hash of what page_text reads from a page, much cheaper to compute than the text itself"""
+    doc = page.parent
+    digest = hashlib.sha256(page.read_contents())
+    # Text drawn through form XObjects and the fonts used both change what get_text returns
+    for xref, *_ in page.get_xobjects():
+        digest.update(doc.xref_stream(xref) or b"")
+    digest.update(repr([font[1:] for font in page.get_fonts()]).encode("utf-8"))
+    digest.update(repr((tuple(page.rect), page.rotation)).encode("utf-8"))
+    if include_images:
+        digest.update(str(len(page.get_images(full=True))).encode("utf-8"))
+    return digest.hexdigest()
+
+def extract_pages(pdf_path, page_indexes, include_images=True):
+    """Extract the given pages with a document handle owned by this worker"""
+    with open_pdf(pdf_path) as doc:
+        return [page_text(doc[page_index], page_index + 1, include_images) for page_index in page_indexes]
+
+def iter_pages_pool(pdf_path, page_indexes, include_images=True, workers=None):
+    """Yield the text of the given pages in order, extracted in contiguous slices by a process pool"""
+    workers = workers or os.cpu_count() or 1
+    step = -(-len(page_indexes) // workers)
+    slices = [page_indexes[i:i + step] for i in range(0, len(page_indexes), step)]
+
+    with ProcessPoolExecutor(max_workers=len(slices)) as pool:
+        for pages in pool.map(extract_pages, [pdf_path] * len(slices), slices, [include_images] * len(slices)):
+            yield from pages
+
+def iter_pages_memo(pdf_path, memo, include_images=True, parallel=False, workers=None):
+    """iter_pages that only extracts pages whose fingerprint is not in memo
+
+    memo maps page fingerprints to page text without the page header, as left
+    by an earlier run; afterwards it holds exactly the pages of this document.
+    With parallel=True every page is fingerprinted first, and if enough of
+    them missed they are extracted in a process pool.
+    """
+    previous = dict(memo)
+    memo.clear()
+    with open_pdf(pdf_path) as doc:
+        if parallel:
+            keys = [page_fingerprint(page, include_images) for page in doc]
+            missed = [page_index for page_index, key in enumerate(keys) if key not in previous]
+            if len(missed) >= PARALLEL_MIN_PAGES:
+                extracted = iter_pages_pool(pdf_path, missed, include_images, workers)
+                for page_num, key in enumerate(keys, start=1):
+                    body = previous.get(key)
+                    if body is None:
+                        body = next(extracted).split("\n", 1)[1]
+                    memo[key] = body
+                    yield f"--- Page {page_num} ---\n{body}"
+                return
+
+        for page_num, page in enumerate(doc, start=1):
+            key = page_fingerprint(page, include_images)
+            body = previous.get(key)
+            if body is None:
+                # Stored without the "--- Page N ---" line so pages can move
+                body = page_text(page, page_num, include_images).split("\n", 1)[1]
+            memo[key] = body
+            yield f"--- Page {page_num} ---\n{body}"
+
+def iter_pages(pdf_path, include_images=True, parallel=False, workers=None, memo=None):
+    """Yield the text of each page in order, in the format extract_text_and_note_images writes
+
+    With parallel=True, contiguous page ranges are extracted in a process pool
+    and merged back in page order. With a memo (see iter_pages_memo), only
+    changed pages are extracted.
+    """
+    if memo is not None:
+        yield from iter_pages_memo(pdf_path, memo, include_images, parallel, workers)
+        return
+
+    with open_pdf(pdf_path) as doc:
+        page_count = len(doc)
+        if not (parallel and page_count >= PARALLEL_MIN_PAGES):
+            for page_num, page in enumerate(doc, start=1):
+                yield page_text(page, page_num, include_images)
+            return
+
+    yield from iter_pages_pool(pdf_path, list(range(page_count)), include_images, workers)
 
-        output_lines.append("")  # Blank line between pages
+def extract_text_and_note_images(pdf_path, output_path, parallel=False, workers=None, include_images=True):
+    pages = list(iter_pages(pdf_path, include_images=include_images, parallel=parallel, workers=workers))
 
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
 
     with open(output_path, "w", encoding="utf-8") as f:
-        f.write("\n".join(output_lines))
+        f.write("\n".join(pages))
 
-    print(f"[✓] Extracted {len(doc)} pages and saved to {output_path}")
+    print(f"[✓] Extracted {len(pages)} pages and saved to {output_path}")
 
 if __name__ == "__main__":
     pdf_path = "uploads/dsa.pdf"  # ← Change this to your actual file
@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import uuid
+from contextlib import ExitStack
+
+from metrics import log_event # structured per-stage trace logs
+
+from textChunk import iter_chunks, iter_token_chunks, CHUNKER_VERSION # streaming pages into chunks
+from quizGeneration import make_generator, GENERATOR_VERSION # streaming chunks into quiz records
+from quizExport import QuizWriter # streaming quiz records to disk
+from quizDedupe import QuestionDeduper # dropping questions repeated across chunks
+
+STAGES = ['extract', 'chunk', 'generate']
+
+# One memo per stage (extract, chunk, generate), each keyed by a content hash of that stage's input
+MEMO_KEYS = ('pages', 'sections', 'pieces')
+
+
+def memo_version(backend='regex', include_images=True, chunker='words'):
+    return f"c{CHUNKER_VERSION}g{GENERATOR_VERSION}-{chunker}-{backend}-{'images' if include_images else 'text'}"
+
+
+def load_memo(path, backend='regex', include_images=True, chunker='words'):
+    """Stage memo saved by an earlier run, or an empty one if missing or from other settings"""
+    memo = {name: {} for name in MEMO_KEYS}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return memo
+    if saved.get('version') == memo_version(backend, include_images, chunker):
+        for name in memo:
+            memo[name] = saved.get(name) or {}
+    return memo
+
+
+def save_memo(path, memo, backend='regex', include_images=True, chunker='words'):
+    tmp_path = f"{path}.{uuid.uuid4().hex}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(dict(memo, version=memo_version(backend, include_images, chunker)), f)
+    os.replace(tmp_path, path)
+
+
+def stream_quiz(pdf_path, text_out=None, chunks_out=None, include_images=True, parallel=False, workers=None,
+                backend='regex', chunker='words', scoring='frequency', dedupe_threshold=None, memo=None,
+                on_progress=None, trace_id=None):
+    """Yield quiz records for a PDF as soon as each chunk has been processed
+
+    Pages flow into the chunker and chunks flow into the generator without
+    touching disk. text_out and chunks_out optionally keep the same .txt and
+    _chunks.txt files the file-based pipeline writes, as debug artifacts.
+    backend picks the question generator ('regex' or 't5') and chunker the
+    chunking engine ('words' for iter_chunks, 'tokens' for iter_token_chunks).
+    scoring ranks the regex generator's terms per chunk ('frequency') or
+    across the whole document ('tfidf'). With dedupe_threshold, questions
+    repeating an earlier one (see QuestionDeduper) are dropped as they stream.
+    workers > 1 fans chunks out to that many generation processes.
+    memo (see load_memo) carries page, section and piece results over from an
+    earlier run of an edited document: only what changed is re-extracted,
+    re-chunked and regenerated, and memo is updated in place for this run.
+    on_progress is called with a dict of the furthest stage reached, the
+    finished stages, page/chunk/question/duplicate counts and the seconds spent in
+    each stage so far. Each finished stage is logged under trace_id.
+    """
+    state = {'stage': 'extract', 'done': [], 'pages': 0, 'chunks': 0, 'questions': 0, 'duplicates': 0}
+    timings = {stage: 0.0 for stage in STAGES}
+
+    def report(stage=None):
+        if stage is not None and STAGES.index(stage) > STAGES.index(state['stage']):
+            state['stage'] = stage
+        if on_progress is not None:
+            on_progress(dict(state, done=list(state['done']), timings=dict(timings)))
+
+    def finish(stage):
+        if stage not in state['done']:
+            state['done'].append(stage)
+            log_event('stage', trace_id, stage=stage, seconds=round(timings[stage], 6),
+                      pages=state['pages'], chunks=state['chunks'], questions=state['questions'],
+                      duplicates=state['duplicates'])
+            report(stage)
+
+    def timed(iterable, stage, inner=()):
+        # Stages are interleaved, so each is charged the time spent producing its
+        # items minus the time the stages feeding it took meanwhile
+        iterator = iter(iterable)
+        while True:
+            inner_before = sum(timings[name] for name in inner)
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                inner_spent = sum(timings[name] for name in inner) - inner_before
+                timings[stage] += time.perf_counter() - started - inner_spent
+            yield item
+
+    with ExitStack() as stack:
+        text_file = stack.enter_context(open(text_out, 'w', encoding='utf-8')) if text_out else None
+        chunks_file = stack.enter_context(open(chunks_out, 'w', encoding='utf-8')) if chunks_out else None
+
+        def pages():
+            from pdf_text import iter_pages
+            page_stream = iter_pages(pdf_path, include_images=include_images, parallel=parallel,
+                                     memo=memo['pages'] if memo is not None else None)
+            for page in timed(page_stream, 'extract'):
+                if text_file:
+                    text_file.write(("\n" if state['pages'] else "") + page)
+                state['pages'] += 1
+                report()
+                yield page
+            finish('extract')
+
+        def chunks(page_stream):
+            if chunker == 'tokens':
+                chunk_stream = iter_token_chunks(page_stream)
+            else:
+                chunk_stream = iter_chunks(page_stream, memo=memo['sections'] if memo is not None else None)
+            for chunk in timed(chunk_stream, 'chunk', inner=('extract',)):
+                state['chunks'] += 1
+                if chunks_file:
+                    chunks_file.write(f"\n--- Chunk {state['chunks']} ---\n")
+                    chunks_file.write(chunk + '\n')
+                report('chunk')
+                yield chunk
+            finish('chunk')
+
+        page_stream = pages()
+        generator = make_generator(backend, scoring)
+        report()
+        records = generator.process_chunks(chunks(page_stream), workers=workers,
+                                           memo=memo['pieces'] if memo is not None else None)
+        # Deduplication runs after the memo, which keeps every piece's own questions
+        deduper = QuestionDeduper(dedupe_threshold) if dedupe_threshold is not None else None
+        if deduper is not None:
+            records = deduper.dedupe(records)
+        for record in timed(records, 'generate', inner=('extract', 'chunk')):
+            state['questions'] += len(record['questions'])
+            state['duplicates'] = deduper.removed if deduper is not None else 0
+            report('generate')
+            yield record
+
+        if deduper is not None:
+            state['duplicates'] = deduper.removed
+
+        # The chunker stops reading at excluded sections; finish the text artifact anyway
+        if text_file:
+            for _ in page_stream:
+                pass
+        finish('extract')
+        finish('generate')
+
+
+def generate_quiz_from_pdf(pdf_path: str, json_out: str, csv_out: str, text_out=None, chunks_out=None,
+                           parallel=False, workers=None, backend='regex', chunker='words', scoring='frequency',
+                           dedupe_threshold=None, memo=None, on_progress=None, trace_id=None, exports=None):
+    """Run the streaming pipeline end to end, writing each quiz record out as soon as it is generated
+
+    json_out and csv_out get the compact streamed JSON and CSV (see QuizWriter);
+    exports optionally maps further formats, e.g. 'jsonl' or 'parquet', to paths.
+    """
+    quiz_data = []
+    with QuizWriter({'json': json_out, 'csv': csv_out, **(exports or {})}) as writer:
+        for record in stream_quiz(pdf_path, text_out=text_out, chunks_out=chunks_out,
+                                  parallel=parallel, workers=workers, backend=backend, chunker=chunker,
+                                  scoring=scoring, dedupe_threshold=dedupe_threshold, memo=memo,
+                                  on_progress=on_progress, trace_id=trace_id):
+            writer.write(record)
+            quiz_data.append(record)
+
+    if quiz_data:
+        print(f"[✓] Generated {sum(len(chunk['questions']) for chunk in quiz_data)} questions")
+        print(f"Successfully saved {len(quiz_data)} records to {', '.join(writer.paths.values())}")
+    else:
+        print("[!] No quiz questions generated.")
+
+    return quiz_data
+
+
+if __name__ == "__main__":
+    import sys
+
+    pdf_path = sys.argv[1] if len(sys.argv) > 1 else "uploads/bionotes.pdf"
+    for record in stream_quiz(pdf_path):
+        for question in record['questions']:
+            print(f"[{record['chunk_number']}] {question['question']} -> {question['answer']}")
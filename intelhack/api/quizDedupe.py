@@ -0,0 +1,100 @@
+import os
+import re
+import random
+import hashlib
+from typing import Dict, Iterable, Iterator, List
+
+# Drop repeated questions from generated quizzes; answers sharing at least
+# DEDUPE_THRESHOLD of their word pairs (Jaccard similarity) count as repeats
+DEDUPE = os.environ.get('QUIZ_DEDUPE', '1') == '1'
+DEDUPE_THRESHOLD = float(os.environ.get('QUIZ_DEDUPE_THRESHOLD', 0.8))
+
+NUM_PERM = 64
+WORD_REGEX = re.compile(r'\w+')
+
+# Each MinHash function XORs the 64-bit shingle hashes with its own mask, which is
+# several times cheaper in Python than (a * h + b) mod p. Fixed masks keep
+# signatures, and so the output, the same in every process.
+_rng = random.Random(20240601)
+MASKS = [_rng.getrandbits(64) for _ in range(NUM_PERM)]
+
+
+def shingles(text: str) -> set:
+    """Hashes of the text's lowercased word pairs (or its one word)"""
+    words = WORD_REGEX.findall(text.lower())
+    grams = [' '.join(words[i:i + 2]) for i in range(max(len(words) - 1, 1))]
+    return {int.from_bytes(hashlib.blake2b(gram.encode('utf-8'), digest_size=8).digest(), 'big') for gram in grams}
+
+
+def minhash(hashes: set) -> List[int]:
+    return [min([h ^ mask for h in hashes]) for mask in MASKS]
+
+
+def lsh_bands(threshold: float, num_perm: int = NUM_PERM):
+    """Bands and rows per band for signatures of num_perm hashes
+
+    Two signatures with Jaccard similarity s share a band with probability
+    1 - (1 - s^rows)^bands, which climbs steeply around (1 / bands)^(1 / rows).
+    That point is put as close below threshold as possible so near-duplicates
+    are rarely missed; candidates are checked exactly, so false positives only
+    cost time.
+    """
+    options = [(bands, num_perm // bands) for bands in range(1, num_perm + 1) if num_perm % bands == 0]
+    point = lambda option: (1 / option[0]) ** (1 / option[1])
+    below = [option for option in options if point(option) <= threshold]
+    return max(below, key=point) if below else min(options, key=point)
+
+
+class QuestionDeduper:
+    """Drops questions that repeat an earlier one, in one pass over the quiz
+
+    A question is a duplicate if its term and answer are exactly those of an
+    earlier question, or if its answer is a near-duplicate of an earlier
+    answer (Jaccard similarity of word pairs >= threshold). Exact repeats are
+    caught by hashing; near-duplicates by MinHash signatures bucketed with
+    LSH, so each answer is only compared with the few earlier answers that
+    share a bucket instead of with all of them.
+    """
+
+    def __init__(self, threshold: float = DEDUPE_THRESHOLD):
+        self.threshold = threshold
+        self.bands, self.rows = lsh_bands(threshold)
+        self.exact = set()
+        self.buckets = {}
+        self.kept = []  # shingle sets of kept answers, indexed by bucket entries
+        self.removed = 0
+
+    def is_duplicate(self, question: Dict[str, str]) -> bool:
+        answer = ' '.join(question['answer'].lower().split())
+        key = hashlib.sha256(f"{' '.join(question.get('term', '').lower().split())}\x00{answer}".encode('utf-8')).digest()
+        if key in self.exact:
+            return True
+
+        hashes = shingles(answer)
+        signature = minhash(hashes)
+        band_keys = [(band, tuple(signature[band * self.rows:(band + 1) * self.rows])) for band in range(self.bands)]
+        candidates = set()
+        for band_key in band_keys:
+            candidates.update(self.buckets.get(band_key, ()))
+        for candidate in candidates:
+            other = self.kept[candidate]
+            if len(hashes & other) >= self.threshold * len(hashes | other):
+                return True
+
+        self.exact.add(key)
+        for band_key in band_keys:
+            self.buckets.setdefault(band_key, []).append(len(self.kept))
+        self.kept.append(hashes)
+        return False
+
+    def dedupe(self, records: Iterable[Dict[str, any]]) -> Iterator[Dict[str, any]]:
+        """Yield records without questions seen before; records left with none are dropped"""
+        for record in records:
+            questions = []
+            for question in record['questions']:
+                if self.is_duplicate(question):
+                    self.removed += 1
+                else:
+                    questions.append(question)
+            if questions:
+                yield dict(record, questions=questions) if len(questions) < len(record['questions']) else record
@@ -0,0 +1,175 @@
+import os
+import csv
+import json
+import importlib
+
+try:
+    import orjson  # optional: a faster encoder for the JSON outputs
+except ImportError:
+    orjson = None
+
+# Extra formats written next to quiz.json, quiz.csv and quiz.jsonl for every job, e.g. "parquet"
+EXPORT_FORMATS = [name.strip() for name in os.environ.get('QUIZ_EXPORT_FORMATS', '').split(',') if name.strip()]
+
+FORMATS = ('json', 'jsonl', 'csv', 'msgpack', 'parquet')
+FILE_NAMES = {'json': 'quiz.json', 'jsonl': 'quiz.jsonl', 'csv': 'quiz.csv',
+              'msgpack': 'quiz.msgpack', 'parquet': 'quiz.parquet'}
+MIME_TYPES = {'json': 'application/json', 'jsonl': 'application/x-ndjson', 'csv': 'text/csv',
+              'msgpack': 'application/msgpack', 'parquet': 'application/vnd.apache.parquet'}
+
+# Optional libraries some formats need, only imported once one of those formats is used
+FORMAT_LIBRARIES = {'msgpack': ('msgpack',), 'parquet': ('pyarrow', 'pyarrow.parquet')}
+
+CSV_HEADER = ['Chunk Number', 'Text Preview', 'Question', 'Answer', 'Term']
+PARQUET_ROW_GROUP = 10_000
+
+
+def dumps(obj):
+    """Compact UTF-8 JSON bytes, through orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def load_formats(formats):
+    """Import the libraries the formats need, raising ValueError for unknown formats or missing libraries"""
+    for name in formats:
+        if name not in FORMATS:
+            raise ValueError(f"Unknown export format {name!r}, expected one of {', '.join(FORMATS)}")
+        for module in FORMAT_LIBRARIES.get(name, ()):
+            try:
+                importlib.import_module(module)
+            except ImportError:
+                raise ValueError(f"The {name} export needs the {module.split('.')[0]} package") from None
+
+
+def read_jsonl(path, offset=0):
+    """Records of a JSON Lines file from line offset on; it may still be being written, so an unfinished last line is left out"""
+    records = []
+    try:
+        with open(path, 'rb') as f:
+            for number, line in enumerate(f):
+                if not line.endswith(b'\n'):
+                    break
+                if number >= offset:
+                    records.append(json.loads(line))
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def question_rows(record):
+    for question in record['questions']:
+        yield record['chunk_number'], record['text_preview'], question['question'], question['answer'], question.get('term', '')
+
+
+class QuizWriter:
+    """Writes quiz records to one or more files as they are generated
+
+    paths maps a format from FORMATS to the file it is written to:
+
+    - json: one compact JSON array, the same data save_output writes
+    - jsonl: one chunk record per line, each written out whole as soon as it
+      arrives, so the file can be read while the quiz is still generated
+    - csv: one question per row; the text preview is only written on the
+      first row of each chunk instead of being repeated on every row
+    - msgpack: a stream of packed chunk records (needs msgpack)
+    - parquet: a flat question table for analytics across quizzes (needs pyarrow)
+
+    Nothing is kept in memory apart from the current Parquet row group.
+    """
+
+    def __init__(self, paths):
+        load_formats(paths)
+
+        self.paths = dict(paths)
+        self.count = 0
+        self.files = {}
+        self.csv_writer = None
+        self.packer = None
+        self.parquet_writer = None
+        self.parquet_rows = []
+        self.closed = False
+
+        try:
+            for name, path in self.paths.items():
+                if name == 'csv':
+                    # csv does its own line endings; without newline='' they are doubled on Windows
+                    self.files[name] = open(path, 'w', encoding='utf-8', newline='')
+                    self.csv_writer = csv.writer(self.files[name])
+                    self.csv_writer.writerow(CSV_HEADER)
+                elif name == 'jsonl':
+                    self.files[name] = open(path, 'wb', buffering=0)
+                elif name != 'parquet':
+                    self.files[name] = open(path, 'wb')
+            if 'json' in self.files:
+                self.files['json'].write(b'[')
+            if 'msgpack' in self.files:
+                import msgpack
+                self.packer = msgpack.Packer()
+        except Exception:
+            self.close(finished=False)
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(finished=exc_type is None)
+
+    def write(self, record):
+        if 'json' in self.files or 'jsonl' in self.files:
+            data = dumps(record)
+            if 'json' in self.files:
+                self.files['json'].write(b',' + data if self.count else data)
+            if 'jsonl' in self.files:
+                self.files['jsonl'].write(data + b'\n')
+        if self.csv_writer is not None:
+            preview = record['text_preview']
+            for chunk_number, _, question, answer, term in question_rows(record):
+                self.csv_writer.writerow([chunk_number, preview, question, answer, term])
+                preview = ''
+        if self.packer is not None:
+            self.files['msgpack'].write(self.packer.pack(record))
+        if 'parquet' in self.paths:
+            self.parquet_rows.extend(question_rows(record))
+            if len(self.parquet_rows) >= PARQUET_ROW_GROUP:
+                self.flush_parquet()
+        self.count += 1
+
+    def flush_parquet(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        columns = list(zip(*self.parquet_rows)) or [[]] * 5
+        table = pa.table({
+            'chunk_number': pa.array(columns[0], pa.int32()),
+            # Every question of a chunk shares its preview, which dictionary encoding stores once
+            'text_preview': pa.array(columns[1], pa.string()).dictionary_encode(),
+            'question': pa.array(columns[2], pa.string()),
+            'answer': pa.array(columns[3], pa.string()),
+            'term': pa.array(columns[4], pa.string()),
+        })
+        if self.parquet_writer is None:
+            self.parquet_writer = pq.ParquetWriter(self.paths['parquet'], table.schema, compression='zstd')
+        self.parquet_writer.write_table(table)
+        self.parquet_rows = []
+
+    def close(self, finished=True):
+        """Finish every file; with finished=False (after an error) they are only closed"""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if finished:
+                if 'json' in self.files:
+                    self.files['json'].write(b']')
+                if 'parquet' in self.paths and (self.parquet_rows or self.parquet_writer is None):
+                    self.flush_parquet()
+            if self.parquet_writer is not None:
+                self.parquet_writer.close()
+                self.parquet_writer = None
+        finally:
+            for f in self.files.values():
+                f.close()
+            self.files = {}
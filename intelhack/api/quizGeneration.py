@@ -1,11 +1,84 @@
+import os
 import re
 import csv
 import json
-from typing import List, Dict
+import hashlib
+from collections import deque
+from itertools import islice
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Iterable, Iterator, Tuple
+
+# Bump whenever question output changes so cached results are invalidated
+GENERATOR_VERSION = 1
+
+# Question generator used by the upload pipeline: 'regex' or 't5' (see t5Inference.py)
+QUIZ_BACKEND = os.environ.get('QUIZ_BACKEND', 'regex')
+
+# How the regex generator ranks terms: 'frequency' within each chunk, or 'tfidf' across the document
+TERM_SCORING = os.environ.get('QUIZ_TERM_SCORING', 'frequency')
+TERM_SCORINGS = ('frequency', 'tfidf')
+TOP_TERMS = 5
+
+CHUNK_SPLIT_PATTERN = r'\n{2,}|(?=\b(?:Section|Chapter|Unit|TOPIC)\b)'
+
+# Chunks sent to a pool worker per task when generating in parallel
+PARALLEL_BATCH_SIZE = 16
+
+# Generator owned by each pool worker, set once by _init_worker
+_worker_generator = None
+
+
+def _init_worker(generator):
+    global _worker_generator
+    _worker_generator = generator
+
+
+def _process_batch(batch):
+    return [_worker_generator.process_chunk(*piece) for piece in batch]
+
+
+class SentenceIndex:
+    """Sentences of one chunk, split and lowercased once, with a term -> sentence lookup
+
+    All lowercased sentences are joined with a separator no term can contain,
+    so the first sentence containing a term is one str.find plus a bisect
+    over the sentence start offsets. Lookups are remembered per term.
+    """
+
+    SEPARATOR = '\x00'
+
+    def __init__(self, text: str, sentence_regex: re.Pattern):
+        self.sentences = sentence_regex.split(text)
+        lowered = [sent.lower() for sent in self.sentences]
+        self.starts = []
+        offset = 0
+        for sent in lowered:
+            self.starts.append(offset)
+            offset += len(sent) + 1
+        self.lowered_text = self.SEPARATOR.join(lowered)
+        self.term_sentences = {}
+
+    def sentence_ids(self, term: str) -> List[int]:
+        """Offsets of every sentence whose lowercased text contains term, in order"""
+        term_lower = term.lower()
+        ids = self.term_sentences.get(term_lower)
+        if ids is None:
+            ids = []
+            pos = self.lowered_text.find(term_lower)
+            while pos != -1:
+                sentence_id = bisect_right(self.starts, pos) - 1
+                ids.append(sentence_id)
+                # Continue from the next sentence; one hit per sentence is enough
+                if sentence_id + 1 >= len(self.starts):
+                    break
+                pos = self.lowered_text.find(term_lower, self.starts[sentence_id + 1])
+            self.term_sentences[term_lower] = ids
+        return ids
 
 
 class RobustQuizGenerator:
-    def __init__(self):
+    def __init__(self, prefer_definitions: bool = False, term_scoring: str = 'frequency'):
         # Simplified and escaped regex patterns
         self.definition_patterns = [
             r"\b{term}\b (?:is|are|refers to|means|is defined as|is called|is known as|denotes|represents)",
@@ -36,6 +109,33 @@ class RobustQuizGenerator:
             'and', 'the', 'are', 'for', 'with', 'from'
         }
 
+        # When set, find_definition picks the first sentence that matches a
+        # definition pattern instead of the first sentence mentioning the term
+        self.prefer_definitions = prefer_definitions
+
+        # With 'tfidf', terms are ranked by rank_terms across all pieces instead of per chunk
+        if term_scoring not in TERM_SCORINGS:
+            raise ValueError(f"Unknown term scoring '{term_scoring}'")
+        self.term_scoring = term_scoring
+
+        # Everything below is compiled once here rather than on every call
+        self.noise_regex = re.compile(
+            r'--- Page \d+ ---|@Kugonza Arthur H 0701 366474|S\.1 BIOLOGY TEACHING NOTES|--- Chunk \d+ ---'
+        )
+        self.term_regexes = [
+            re.compile(r'\b([A-Z][a-zA-Z]{2,}(?:\s+[A-Z][a-zA-Z]+)*\b)'),  # Capitalized terms
+            re.compile(r'\b([a-z]{3,}\s+(?:theory|concept|method|principle|law|model|cell|tissue|organ|system))\b'),
+            re.compile(r'\b([A-Za-z]{3,}\s+[A-Za-z]{3,})\b(?=\s+is|\s+are|\s+means)'),  # Terms before definitions
+        ]
+        self.sentence_regex = re.compile(r'(?<=[.!?])\s+')
+        self.definition_regexes = {}
+
+
+    def warm_up(self):
+        """Load whatever the generator would otherwise load on first use"""
+        if self.term_scoring == 'tfidf':
+            import termIndex  # numpy
+
 
     def clean_text(self, text: str) -> str:
         """Remove unwanted patterns and clean the text"""
@@ -43,10 +143,7 @@ class RobustQuizGenerator:
             return ""
            
         try:
-            text = re.sub(r'--- Page \d+ ---', '', text)
-            text = re.sub(r'@Kugonza Arthur H 0701 366474', '', text)
-            text = re.sub(r'S\.1 BIOLOGY TEACHING NOTES', '', text)
-            text = re.sub(r'--- Chunk \d+ ---', '', text)
+            text = self.noise_regex.sub('', text)
             return ' '.join(text.split())
         except Exception as e:
             print(f"Error cleaning text: {str(e)}")
@@ -61,83 +158,111 @@ class RobustQuizGenerator:
             return False
 
 
-    def extract_meaningful_terms(self, text: str) -> List[str]:
-        """Extract potential terms for questions with robust patterns"""
-        if not text:
-            return []
-           
-        # Simple and safe patterns
-        patterns = [
-            r'\b([A-Z][a-zA-Z]{2,}(?:\s+[A-Z][a-zA-Z]+)*\b)',  # Capitalized terms
-            r'\b([a-z]{3,}\s+(?:theory|concept|method|principle|law|model|cell|tissue|organ|system))\b',
-            r'\b([A-Za-z]{3,}\s+[A-Za-z]{3,})\b(?=\s+is|\s+are|\s+means)',  # Terms before definitions
-        ]
-       
+    def definition_regex(self, term: str) -> re.Pattern:
+        """All definition patterns for a term as one compiled alternation, cached per term"""
+        regex = self.definition_regexes.get(term)
+        if regex is None:
+            if len(self.definition_regexes) >= 4096:
+                self.definition_regexes.clear()
+            escaped = re.escape(term)
+            regex = re.compile(
+                '|'.join(f'(?:{pat.format(term=escaped)})' for pat in self.definition_patterns),
+                re.IGNORECASE
+            )
+            self.definition_regexes[term] = regex
+        return regex
+
+
+    def term_candidates(self, text: str) -> Dict[str, int]:
+        """Candidate terms in order of first match, with how many times each was a candidate"""
         candidates = []
-        for pattern in patterns:
-            try:
-                matches = re.findall(pattern, text)
-                candidates.extend(matches)
-            except re.error as e:
-                print(f"Regex error with pattern '{pattern}': {str(e)}")
-                continue
+        for regex in self.term_regexes:
+            candidates.extend(regex.findall(text))
        
-        # Filter terms
-        filtered = []
+        multiplicity = {}
         for term in candidates:
             term_lower = term.lower()
             if (term_lower not in self.excluded_terms and
                 len(term.split()) <= 3 and
                 len(term) >= 4 and
                 not term.isnumeric()):
-                filtered.append(term)
+                multiplicity[term] = multiplicity.get(term, 0) + 1
+        return multiplicity
+
+
+    def extract_meaningful_terms(self, text: str) -> List[str]:
+        """Extract potential terms for questions with robust patterns"""
+        if not text:
+            return []
+           
+        multiplicity = self.term_candidates(text)
        
-        # Count occurrences
+        # Count occurrences: lowercase the text once and count each distinct term once
+        text_lower = text.lower()
+        counted = {}
         term_counts = {}
-        for term in filtered:
-            term_counts[term] = term_counts.get(term, 0) + text.lower().count(term.lower())
+        for term, times in multiplicity.items():
+            term_lower = term.lower()
+            if term_lower not in counted:
+                counted[term_lower] = text_lower.count(term_lower)
+            term_counts[term] = times * counted[term_lower]
        
-        return sorted(term_counts.keys(), key=lambda x: term_counts[x], reverse=True)[:5]
+        return sorted(term_counts.keys(), key=lambda x: term_counts[x], reverse=True)[:TOP_TERMS]
 
 
-    def find_definition(self, text: str, term: str) -> str:
+    def find_definition(self, text: str, term: str, index: SentenceIndex = None) -> str:
         """Find a definition or explanation for the given term"""
         if not text or not term:
             return ""
-           
-        sentences = re.split(r'(?<=[.!?])\s+', text)
-        term_lower = term.lower()
-       
-        for sent in sentences:
-            if term_lower in sent.lower():
-                # Try each definition pattern safely
-                for pat in self.definition_patterns:
-                    try:
-                        regex = pat.format(term=re.escape(term))
-                        if re.search(regex, sent, re.IGNORECASE):
-                            return self.clean_text(sent)
-                    except re.error as e:
-                        print(f"Regex error in definition pattern: {str(e)}")
-                        continue
-               
-                # Fallback: return the sentence if it contains the term
-                return self.clean_text(sent)
-       
-        return ""
 
+        if index is None:
+            index = SentenceIndex(text, self.sentence_regex)
+        sentence_ids = index.sentence_ids(term)
+        if not sentence_ids:
+            return ""
+
+        if self.prefer_definitions:
+            regex = self.definition_regex(term)
+            for sentence_id in sentence_ids:
+                if regex.search(index.sentences[sentence_id]):
+                    return self.clean_text(index.sentences[sentence_id])
+
+        # The first sentence mentioning the term is used whether or not it
+        # matches a definition pattern
+        return self.clean_text(index.sentences[sentence_ids[0]])
+
+
+    def rank_terms(self, pieces: Iterable[Tuple[int, str]], k: int = TOP_TERMS) -> List[Tuple[int, str, List[str]]]:
+        """Pair every (index, text) piece with its top k terms by TF-IDF over all the pieces"""
+        from termIndex import TermIndex  # numpy is only imported when TF-IDF scoring is used
+
+        pieces = list(pieces)
+        texts = []
+        for _, piece in pieces:
+            text = self.clean_text(piece.strip())
+            # Pieces process_chunk skips do not count as documents
+            texts.append(text if len(text) >= 100 else '')
+        index = TermIndex(texts, [self.term_candidates(text) for text in texts])
+        return [(idx, piece, terms) for (idx, piece), terms in zip(pieces, index.top_terms(k))]
 
-    def generate_questions(self, text: str) -> List[Dict[str, str]]:
-        """Generate quiz questions with robust error handling"""
+
+    def generate_questions(self, text: str, terms: List[str] = None) -> List[Dict[str, str]]:
+        """Generate quiz questions with robust error handling
+
+        terms, e.g. from rank_terms, replaces the terms found in text itself.
+        """
         if not text:
             return []
            
         cleaned_text = self.clean_text(text)
-        terms = self.extract_meaningful_terms(cleaned_text)
+        if terms is None:
+            terms = self.extract_meaningful_terms(cleaned_text)
+        index = SentenceIndex(cleaned_text, self.sentence_regex)
         questions = []
        
         for i, term in enumerate(terms):
             try:
-                answer = self.find_definition(cleaned_text, term)
+                answer = self.find_definition(cleaned_text, term, index)
                
                 # Skip if answer is poor quality
                 if not answer or len(answer.split()) < 5:
@@ -164,38 +289,152 @@ class RobustQuizGenerator:
         return questions
 
 
-    def process_text(self, full_text: str) -> List[Dict[str, any]]:
+    def process_chunk(self, idx: int, chunk: str, terms: List[str] = None) -> Dict[str, any]:
+        """Generate the quiz record for one piece of text, or None if it yields no questions"""
+        try:
+            chunk = self.clean_text(chunk.strip())
+            if not chunk or len(chunk) < 100:
+                return None
+               
+            questions = self.generate_questions(chunk, terms)
+            if questions:
+                return {
+                    "chunk_number": idx + 1,
+                    "text_preview": chunk[:200] + ("..." if len(chunk) > 200 else ""),
+                    "questions": questions
+                }
+        except Exception as e:
+            print(f"Error processing chunk {idx + 1}: {str(e)}")
+        return None
+
+
+    def process_pieces(self, pieces: Iterable[Tuple[int, str]], workers: int = None,
+                       batch_size: int = PARALLEL_BATCH_SIZE) -> Iterator[Dict[str, any]]:
+        """Yield quiz records for (index, text) pairs, or (index, text, terms) from rank_terms, in order
+
+        With workers > 1 the pieces are sent to a process pool in batches.
+        Records still come back in chunk_number order, and a chunk that fails
+        only loses its own questions.
+        """
+        if not workers or workers <= 1:
+            for piece in pieces:
+                record = self.process_chunk(*piece)
+                if record:
+                    yield record
+            return
+
+        pieces = iter(pieces)
+        pending = deque()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(self,)) as pool:
+            while True:
+                batch = list(islice(pieces, batch_size))
+                if batch:
+                    pending.append((batch, pool.submit(_process_batch, batch)))
+                # Keep a couple of batches per worker in flight, in submission order
+                while pending and (not batch or len(pending) >= workers * 2):
+                    done_batch, future = pending.popleft()
+                    try:
+                        records = future.result()
+                    except Exception as e:
+                        print(f"Error in generation worker, retrying batch locally: {str(e)}")
+                        records = [self.process_chunk(*piece) for piece in done_batch]
+                    for record in records:
+                        if record:
+                            yield record
+                if not batch:
+                    return
+
+
+    def process_text(self, full_text: str, workers: int = None) -> List[Dict[str, any]]:
         """Process the full text with error handling"""
         if not full_text:
             return []
            
         try:
-            chunks = re.split(r'\n{2,}|(?=\b(?:Section|Chapter|Unit|TOPIC)\b)', full_text)
-            results = []
-           
-            for idx, chunk in enumerate(chunks):
-                try:
-                    chunk = self.clean_text(chunk.strip())
-                    if not chunk or len(chunk) < 100:
-                        continue
-                       
-                    questions = self.generate_questions(chunk)
-                    if questions:
-                        results.append({
-                            "chunk_number": idx + 1,
-                            "text_preview": chunk[:200] + ("..." if len(chunk) > 200 else ""),
-                            "questions": questions
-                        })
-                except Exception as e:
-                    print(f"Error processing chunk {idx + 1}: {str(e)}")
-                    continue
-                   
-            return results
+            pieces = enumerate(re.split(CHUNK_SPLIT_PATTERN, full_text))
+            if self.term_scoring == 'tfidf':
+                pieces = self.rank_terms(pieces)
+            return list(self.process_pieces(pieces, workers=workers))
         except Exception as e:
             print(f"Error splitting text into chunks: {str(e)}")
             return []
 
 
+    def process_chunks(self, chunks: Iterable[str], workers: int = None,
+                       memo: Dict[str, any] = None) -> Iterator[Dict[str, any]]:
+        """Yield quiz records as chunks arrive from the chunker
+
+        Numbering matches process_text run on the equivalent _chunks.txt file.
+        With a memo, see process_pieces_memo. TF-IDF scoring needs every chunk
+        before the first term can be ranked, so it waits for the whole document.
+        """
+        def pieces():
+            idx = 0
+            for number, chunk in enumerate(chunks, start=1):
+                for piece in re.split(CHUNK_SPLIT_PATTERN, f"--- Chunk {number} ---\n{chunk}"):
+                    yield idx, piece
+                    idx += 1
+
+        if self.term_scoring == 'tfidf':
+            if memo is not None:
+                memo.clear()  # a piece's terms depend on every other piece, so nothing can be reused
+            return self.process_pieces(self.rank_terms(pieces()), workers=workers)
+        if memo is not None:
+            return self.process_pieces_memo(pieces(), memo, workers=workers)
+        return self.process_pieces(pieces(), workers=workers)
+
+
+    def process_pieces_memo(self, pieces: Iterable[Tuple[int, str]], memo: Dict[str, any],
+                            workers: int = None) -> Iterator[Dict[str, any]]:
+        """process_pieces that only generates questions for pieces missing from memo
+
+        memo maps hashes of cleaned piece text to [text_preview, questions], or
+        None for pieces without questions, as left by an earlier run. Output
+        only depends on the cleaned text, so reused pieces give the same records
+        a full run would. Afterwards memo holds exactly the pieces of this run.
+        """
+        previous = dict(memo)
+        memo.clear()
+        planned = deque()
+        generated = {}
+
+        def misses():
+            for idx, piece in pieces:
+                key = hashlib.sha256(self.clean_text(piece.strip()).encode('utf-8')).hexdigest()
+                reused = key in previous
+                if reused:
+                    memo[key] = previous[key]
+                planned.append((idx, key, reused))
+                if not reused:
+                    yield idx, piece
+
+        def settle(limit):
+            # Emit planned pieces before limit, in order, now that all of them are known
+            while planned and (limit is None or planned[0][0] < limit):
+                idx, key, reused = planned.popleft()
+                if not reused:
+                    record = generated.pop(idx, None)
+                    memo[key] = [record["text_preview"], record["questions"]] if record else None
+                entry = memo[key]
+                if entry:
+                    yield {"chunk_number": idx + 1, "text_preview": entry[0], "questions": entry[1]}
+
+        for record in self.process_pieces(misses(), workers=workers):
+            idx = record["chunk_number"] - 1
+            yield from settle(idx)
+            generated[idx] = record
+        yield from settle(None)
+
+
+def make_generator(backend: str = 'regex', scoring: str = 'frequency') -> RobustQuizGenerator:
+    if backend == 't5':
+        from t5Inference import T5QuizGenerator  # torch/transformers are only imported when asked for
+        return T5QuizGenerator()
+    if backend != 'regex':
+        raise ValueError(f"Unknown quiz backend '{backend}'")
+    return RobustQuizGenerator(term_scoring=scoring)
+
+
 def save_output(data: List[Dict[str, any]], filename: str, format: str = 'json'):
     """Save output in specified format with error handling"""
     if not data:
@@ -203,7 +442,7 @@ def save_output(data: List[Dict[str, any]], filename: str, format: str = 'json')
         return
        
     try:
-        with open(filename, 'w', encoding='utf-8') as f:
+        with open(filename, 'w', encoding='utf-8', newline='' if format == 'csv' else None) as f:
             if format == 'json':
                 json.dump(data, f, ensure_ascii=False, indent=2)
             elif format == 'csv':
@@ -258,7 +497,10 @@ def main():
         print(f"An unexpected error occurred: {str(e)}")
 
 
-def generate_quiz_from_chunk_file(input_path: str, json_out: str, csv_out: str):
+def generate_quiz_from_chunk_file(input_path: str, json_out: str, csv_out: str,
+                                  parallel: bool = False, workers: int = None, backend: str = 'regex',
+                                  dedupe_threshold: float = None):
+    """Generate a quiz from a _chunks.txt file; with dedupe_threshold, repeated questions are dropped"""
     try:
         print(f"[✓] Reading chunked input from: {input_path}")
         with open(input_path, 'r', encoding='utf-8') as f:
@@ -268,8 +510,17 @@ def generate_quiz_from_chunk_file(input_path: str, json_out: str, csv_out: str):
             print("[!] Input file is empty")
             return []
 
-        generator = RobustQuizGenerator()
-        quiz_data = generator.process_text(full_text)
+        if parallel:
+            workers = workers or os.cpu_count() or 1
+
+        generator = make_generator(backend)
+        quiz_data = generator.process_text(full_text, workers=workers if parallel else None)
+
+        if dedupe_threshold is not None:
+            from quizDedupe import QuestionDeduper
+            deduper = QuestionDeduper(dedupe_threshold)
+            quiz_data = list(deduper.dedupe(quiz_data))
+            print(f"[✓] Removed {deduper.removed} duplicate questions")
 
         if quiz_data:
             print(f"[✓] Generated {sum(len(chunk['questions']) for chunk in quiz_data)} questions")
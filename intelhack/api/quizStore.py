@@ -0,0 +1,274 @@
+import json
+import time
+import sqlite3
+import hashlib
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS quizzes (
+    id TEXT PRIMARY KEY,
+    filename TEXT,
+    created REAL NOT NULL,
+    num_chunks INTEGER NOT NULL,
+    total_questions INTEGER NOT NULL,
+    etag TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS quizzes_by_filename ON quizzes (filename, created);
+CREATE TABLE IF NOT EXISTS chunks (
+    quiz_id TEXT NOT NULL REFERENCES quizzes(id) ON DELETE CASCADE,
+    chunk_number INTEGER NOT NULL,
+    text_preview TEXT NOT NULL,
+    PRIMARY KEY (quiz_id, chunk_number)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS questions (
+    quiz_id TEXT NOT NULL REFERENCES quizzes(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    chunk_number INTEGER NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    term TEXT,
+    PRIMARY KEY (quiz_id, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    key TEXT,
+    filename TEXT,
+    status TEXT NOT NULL,
+    created REAL NOT NULL,
+    finished REAL,
+    result TEXT,
+    error TEXT,
+    trace_id TEXT,
+    progress TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_by_finished ON jobs (finished);
+-- At most one unfinished job per cache key, across every server worker
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_inflight ON jobs (key) WHERE finished IS NULL;
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    client TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rate_buckets_by_updated ON rate_buckets (updated);
+"""
+
+MAX_PAGE_SIZE = 100
+
+
+class QuizStore:
+    """SQLite-backed store of generated quizzes, readable one page of questions at a time
+
+    Only the database path is kept on the object, so it can be handed to pool
+    workers; every call opens its own short-lived connection. It also holds the
+    status of upload jobs, so any server worker can answer a poll for a job
+    another worker accepted.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def has_quiz(self, quiz_id):
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT 1 FROM quizzes WHERE id = ?", (quiz_id,)).fetchone() is not None
+        finally:
+            conn.close()
+
+    def latest_quiz_id(self, filename, exclude=None):
+        """ID of the newest quiz generated from an upload with this filename, e.g. last week's version"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT id FROM quizzes WHERE filename = ? AND id != ? ORDER BY created DESC LIMIT 1",
+                (filename, exclude or '')
+            ).fetchone()
+            return row['id'] if row else None
+        finally:
+            conn.close()
+
+    def save_quiz(self, quiz_id, filename, quiz_data):
+        """Store quiz_data (the process_text output) under quiz_id, replacing any previous copy"""
+        etag = hashlib.sha256(json.dumps(quiz_data, sort_keys=True).encode('utf-8')).hexdigest()[:32]
+        questions = []
+        for chunk in quiz_data:
+            for question in chunk['questions']:
+                questions.append((quiz_id, len(questions), chunk['chunk_number'],
+                                  question['question'], question['answer'], question.get('term', '')))
+
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM quizzes WHERE id = ?", (quiz_id,))
+                conn.execute(
+                    "INSERT INTO quizzes (id, filename, created, num_chunks, total_questions, etag) VALUES (?, ?, ?, ?, ?, ?)",
+                    (quiz_id, filename, time.time(), len(quiz_data), len(questions), etag)
+                )
+                conn.executemany(
+                    "INSERT INTO chunks (quiz_id, chunk_number, text_preview) VALUES (?, ?, ?)",
+                    [(quiz_id, chunk['chunk_number'], chunk['text_preview']) for chunk in quiz_data]
+                )
+                conn.executemany(
+                    "INSERT INTO questions (quiz_id, position, chunk_number, question, answer, term) VALUES (?, ?, ?, ?, ?, ?)",
+                    questions
+                )
+        finally:
+            conn.close()
+
+    def get_quiz(self, quiz_id):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM quizzes WHERE id = ?", (quiz_id,)).fetchone()
+            return dict(row) if row else None
+        finally:
+            conn.close()
+
+    def get_questions(self, quiz_id, offset=0, limit=10):
+        """Return questions [offset, offset + limit) of a quiz, in generation order"""
+        limit = max(0, min(limit, MAX_PAGE_SIZE))
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT position, chunk_number, question, answer, term FROM questions "
+                "WHERE quiz_id = ? AND position >= ? ORDER BY position LIMIT ?",
+                (quiz_id, max(0, offset), limit)
+            ).fetchall()
+            return [dict(row) for row in rows]
+        finally:
+            conn.close()
+
+    def save_job(self, job):
+        """Insert or update a JobQueue job record; its progress is written separately by save_job_progress"""
+        result = json.dumps(job['result']) if job['result'] is not None else None
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT INTO jobs (id, key, filename, status, created, finished, result, error, trace_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET "
+                    "status = excluded.status, finished = excluded.finished, result = excluded.result, error = excluded.error",
+                    (job['id'], job['key'], job['filename'], job['status'], job['created'], job['finished'],
+                     result, job['error'], job['trace_id'])
+                )
+        finally:
+            conn.close()
+
+    def claim_job(self, job, stale_after):
+        """Insert an unfinished job unless one is already running for its key; returns the running job's ID
+
+        A job left unfinished for more than stale_after seconds, e.g. by a
+        worker that was killed, is marked failed and its key claimed anew.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            # BEGIN IMMEDIATE takes the write lock up front, so the check and the insert are one step
+            conn.isolation_level = None
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT id, created FROM jobs WHERE key = ? AND finished IS NULL",
+                                   (job['key'],)).fetchone()
+                if row is not None and row['created'] >= now - stale_after:
+                    conn.execute("COMMIT")
+                    return row['id']
+                if row is not None:
+                    conn.execute("UPDATE jobs SET status = 'failed', finished = ?, error = ? WHERE id = ?",
+                                 (now, 'abandoned: no progress for too long', row['id']))
+                conn.execute(
+                    "INSERT INTO jobs (id, key, filename, status, created, finished, result, error, trace_id) "
+                    "VALUES (?, ?, ?, ?, ?, NULL, NULL, NULL, ?)",
+                    (job['id'], job['key'], job['filename'], job['status'], job['created'], job['trace_id'])
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return job['id']
+        finally:
+            conn.close()
+
+    def inflight_job(self, key):
+        """ID of the unfinished job for a cache key, or None"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT id FROM jobs WHERE key = ? AND finished IS NULL", (key,)).fetchone()
+            return row['id'] if row else None
+        finally:
+            conn.close()
+
+    def update_bucket(self, client, update):
+        """Read and rewrite a client's rate-limit bucket in one transaction, so every worker sees one budget
+
+        update gets the stored (tokens, updated) pair, or None for a client
+        without a row, and returns the pair to store and a result to return.
+        """
+        conn = self._connect()
+        try:
+            conn.isolation_level = None
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT tokens, updated FROM rate_buckets WHERE client = ?", (client,)).fetchone()
+                (tokens, updated), result = update((row['tokens'], row['updated']) if row else None)
+                conn.execute("INSERT OR REPLACE INTO rate_buckets (client, tokens, updated) VALUES (?, ?, ?)",
+                             (client, tokens, updated))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return result
+        finally:
+            conn.close()
+
+    def prune_buckets(self, before):
+        """Forget buckets last touched before this time, which have refilled completely since"""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM rate_buckets WHERE updated < ?", (before,))
+        finally:
+            conn.close()
+
+    def save_job_progress(self, job_id, state):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("UPDATE jobs SET progress = ? WHERE id = ?", (json.dumps(state), job_id))
+        finally:
+            conn.close()
+
+    def get_job(self, job_id):
+        """The job record with its result and last reported progress decoded, or None"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        job = dict(row)
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        job['progress'] = json.loads(job['progress']) if job['progress'] else None
+        return job
+
+    def prune_jobs(self, keep):
+        """Delete all but the keep most recently finished jobs; unfinished jobs are kept"""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "DELETE FROM jobs WHERE finished IS NOT NULL AND id NOT IN "
+                    "(SELECT id FROM jobs WHERE finished IS NOT NULL ORDER BY finished DESC LIMIT ?)",
+                    (keep,)
+                )
+        finally:
+            conn.close()
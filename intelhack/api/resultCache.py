@@ -0,0 +1,106 @@
+import os
+import json
+import uuid
+import shutil
+
+from textChunk import CHUNKER_VERSION, CHUNKER_ENGINE
+from quizGeneration import GENERATOR_VERSION, QUIZ_BACKEND, TERM_SCORING
+from quizDedupe import DEDUPE, DEDUPE_THRESHOLD
+
+CACHE_FOLDER = os.path.join('uploads', 'cache')
+MAX_CACHE_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+# Non-default chunkers and generators get cache entries of their own
+PIPELINE_VERSION = f"c{CHUNKER_VERSION}g{GENERATOR_VERSION}"
+if CHUNKER_ENGINE != 'words':
+    PIPELINE_VERSION += f"-{CHUNKER_ENGINE}"
+if QUIZ_BACKEND != 'regex':
+    PIPELINE_VERSION += f"-{QUIZ_BACKEND}"
+elif TERM_SCORING != 'frequency':
+    PIPELINE_VERSION += f"-{TERM_SCORING}"
+if DEDUPE:
+    PIPELINE_VERSION += f"-d{DEDUPE_THRESHOLD:g}"
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class ResultCache:
+    """Size-bounded LRU cache of pipeline artifacts, keyed by PDF content hash
+
+    Each entry is a directory holding the source PDF, extracted text, chunks
+    and quiz output. An entry only counts as complete once its meta.json has
+    been written; the directory mtime records when it was last used.
+    """
+
+    def __init__(self, folder=CACHE_FOLDER, max_bytes=MAX_CACHE_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        os.makedirs(self.folder, exist_ok=True)
+
+    def key_for(self, digest):
+        return f"{digest}-{PIPELINE_VERSION}"
+
+    def entry_dir(self, key):
+        return os.path.join(self.folder, key)
+
+    def url_for(self, key, format):
+        """Where server.py serves the entry's quiz file in format, e.g. 'json' or 'csv'"""
+        return f'/api/quizzes/{key}/export/{format}'
+
+    def get(self, key):
+        """Return the stored pipeline result for key, or None on a miss"""
+        entry = self.entry_dir(key)
+        try:
+            with open(os.path.join(entry, 'meta.json'), 'r', encoding='utf-8') as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        # Mark as recently used
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return result
+
+    def put(self, key, result):
+        entry = self.entry_dir(key)
+        tmp_meta = os.path.join(entry, f"meta.json.{uuid.uuid4().hex}")
+        with open(tmp_meta, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        os.replace(tmp_meta, os.path.join(entry, 'meta.json'))
+        os.utime(entry)
+        self.evict(keep=key)
+
+    def discard(self, key):
+        shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+
+    def evict(self, keep=None):
+        """Drop least recently used complete entries until the cache fits in max_bytes"""
+        entries = []
+        total = 0
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            if not os.path.isdir(path):
+                continue
+            size = _dir_size(path)
+            total += size
+            # Entries still being generated have no meta.json yet and are never evicted
+            if name != keep and os.path.exists(os.path.join(path, 'meta.json')):
+                entries.append((os.path.getmtime(path), size, path))
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
@@ -1,25 +1,121 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, g, send_file
+from werkzeug.security import safe_join
 from flask_cors import CORS
 import os
-import shutil
+import json
+import time
+import uuid
+import logging
 
-from pdf_text import extract_text_and_note_images # converting the pdf to text
-from textChunk import process_text_and_chunk #converting the text to chunks
-from quizGeneration import generate_quiz_from_chunk_file # generating the 
+from jobQueue import JobQueue, QueueFullError # running the pdf -> text -> chunks -> quiz pipeline
+from resultCache import ResultCache # reusing results for PDFs we have already seen
+from quizStore import QuizStore, MAX_PAGE_SIZE # serving quizzes a page of questions at a time
+from uploadStream import StreamingUploadRequest, MAX_UPLOAD_BYTES, storage_name, discard_spooled_files # spooling uploads to disk
+from metrics import REGISTRY, Counter, Gauge, Histogram, log_event # /api/metrics and trace logs
+from staticAssets import StaticAssets # serving the built React app
+from admission import RateLimiter, API_KEYS # per-client upload budgets
+from quizExport import FILE_NAMES, MIME_TYPES, read_jsonl # quiz files kept in each cache entry
 
-app = Flask(__name__, static_folder=os.path.abspath(os.path.join(os.path.dirname(__file__), '../dist')), static_url_path='')
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'), format='%(message)s')
+
+# The React build is served from an in-memory index (see staticAssets.py) rather than Flask's static route
+DIST_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), '../dist'))
+app = Flask(__name__, static_folder=None)
 CORS(app) # Enable CORS so React can access this server
 
 UPLOAD_FOLDER = 'uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+cache = ResultCache(os.path.join(UPLOAD_FOLDER, 'cache'))
+store = QuizStore(os.path.join(UPLOAD_FOLDER, 'quizzes.db'))
+# Job status is written through to the store, so any gunicorn worker can answer a poll
+jobs = JobQueue(store=store)
+
+# Uploads are spooled next to the cache so they can be moved into an entry without copying
+app.request_class = StreamingUploadRequest
+app.config['UPLOAD_SPOOL_FOLDER'] = cache.folder
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
+assets = StaticAssets(DIST_FOLDER)
+# Budgets are kept in the store too, so a client gets one budget however many workers it reaches
+limiter = RateLimiter(store=store)
+
+REQUEST_SECONDS = Histogram('http_request_seconds', 'HTTP request latency', ['method', 'endpoint', 'status'])
+UPLOADS = Counter('upload_requests_total', 'PDF uploads by how they were handled', ['result'])
+QUEUE_DEPTH = Gauge('pipeline_queue_depth', 'Pipeline jobs queued or running', jobs.queue_depth)
+
+def ensure_stored(key, filename):
+    # Cache entries can outlive the quiz database, e.g. after it was deleted
+    if store.has_quiz(key):
+        return
+    json_path = os.path.join(cache.entry_dir(key), 'quiz.json')
+    quiz_data = []
+    if os.path.exists(json_path):
+        with open(json_path, 'r', encoding='utf-8') as f:
+            quiz_data = json.load(f)
+    store.save_quiz(key, filename, quiz_data)
+
+def client_id():
+    # A known API key follows a client across addresses; everyone else is limited per IP,
+    # so made-up keys cannot be used to get a fresh budget per request
+    api_key = request.headers.get('X-API-Key')
+    return f'key:{api_key}' if api_key in API_KEYS else f'ip:{request.remote_addr}'
+
+def retry_later(message, retry_after, status=429):
+    response = jsonify({'message': message, 'retry_after': retry_after})
+    response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def conditional_json(payload, etag):
+    response = jsonify(payload)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.before_request
+def start_trace():
+    # Callers may pass their own ID to follow a request across services
+    g.trace_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+    g.started = time.perf_counter()
+
+@app.after_request
+def finish_trace(response):
+    elapsed = time.perf_counter() - g.started
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    REQUEST_SECONDS.observe(elapsed, method=request.method, endpoint=endpoint, status=response.status_code)
+    response.headers['X-Request-ID'] = g.trace_id
+    # Status polling would drown everything else out; log uploads and errors
+    if endpoint.startswith('/api/') and (request.method != 'GET' or response.status_code >= 400):
+        log_event('request', g.trace_id, method=request.method, path=request.path,
+                  status=response.status_code, seconds=round(elapsed, 6))
+    return response
+
+@app.teardown_request
+def cleanup_uploads(exc):
+    discard_spooled_files(request)
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    return jsonify({'message': e.description}), 413
+
 # filepath: intel-hack/intelhack/api/server.py
 @app.route('/api', methods=['GET'])
 def home():
     return jsonify({'message': 'Server is running!'})
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    return REGISTRY.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 @app.route('/api/upload', methods=['POST'])
 def upload_pdf():
+    # Turn away clients with an empty budget before their upload is read
+    client = client_id()
+    retry_after = limiter.retry_after(client)
+    if retry_after:
+        UPLOADS.inc(result='rate_limited')
+        return retry_later('Too many uploads, please try again later', retry_after)
+
     if 'pdf' not in request.files:
         return jsonify({'message': 'No file part in the request'}), 400
 
@@ -27,56 +123,161 @@ def upload_pdf():
     if file.filename == '':
         return jsonify({'message': 'No selected file'}), 400
     
-    pdf_filename = file.filename
-    base_name = os.path.splitext(pdf_filename)[0]
-    pdf_path = os.path.join(UPLOAD_FOLDER, pdf_filename)
+    pdf_filename = storage_name(file.filename)
+    upload = file.stream
+    if not upload.looks_like_pdf():
+        UPLOADS.inc(result='rejected')
+        return jsonify({'message': 'Uploaded file is not a PDF'}), 400
 
+    cost = 0
     try:
-        # Step 1: Save PDF
-        file.save(pdf_path)
-
-        # Step 2: Extract text
-        text_path = os.path.join(UPLOAD_FOLDER, f"{base_name}.txt")
-        extract_text_and_note_images(pdf_path, text_path)
+        # The upload was hashed while it was spooled; artifacts are stored by content, not by filename
+        key = cache.key_for(upload.hexdigest())
 
-        # Step 3: Chunk text
-        chunk_output_path = os.path.join(UPLOAD_FOLDER, f"{base_name}_chunks.txt")
-        process_text_and_chunk(text_path, chunk_output_path)
+        result = cache.get(key)
+        if result is not None:
+            ensure_stored(key, pdf_filename)
+            result = dict(result, quiz_id=key)
+            job_id = jobs.complete(result, filename=pdf_filename, trace_id=g.trace_id)
+            UPLOADS.inc(result='cached')
+            return jsonify({
+                'message': 'Upload and quiz generation complete!',
+                'cached': True,
+                'job_id': job_id,
+                'status_url': f'/api/jobs/{job_id}',
+                'result_url': f'/api/jobs/{job_id}/result',
+                **result
+            })
 
-        # Step 4: Generate quiz questions
-        json_output_path = os.path.join(UPLOAD_FOLDER, f"{base_name}_quiz.json")
-        csv_output_path = os.path.join(UPLOAD_FOLDER, f"{base_name}_quiz.csv")
-        quiz_data = generate_quiz_from_chunk_file(chunk_output_path, json_output_path, csv_output_path)
+        # New documents cost one token per page, so large PDFs use up more of the client's budget;
+        # joining a job already running for the same document is free
+        if not jobs.is_inflight(key):
+            from pdf_text import page_count  # PyMuPDF is imported on first use, or by wsgi.warm_up
+            upload.flush()
+            try:
+                cost = page_count(upload.path)
+            except Exception:
+                UPLOADS.inc(result='rejected')
+                return jsonify({'message': 'Uploaded file could not be read as a PDF'}), 400
+            retry_after = limiter.take(client, cost)
+            if retry_after:
+                UPLOADS.inc(result='rate_limited')
+                return retry_later(f'This {cost}-page PDF is over your upload budget, please try again later',
+                                   retry_after)
 
-        # Path to the React public directory (adjust this if needed)
-        frontend_public_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../intelhack/public'))
-        public_json_path = os.path.join(frontend_public_path, 'quizData.json')
+        def move_into_cache():
+            # Only the job that claimed the key writes its cache entry, whichever worker runs it
+            os.makedirs(cache.entry_dir(key), exist_ok=True)
+            upload.claim(os.path.join(cache.entry_dir(key), 'source.pdf'))
 
-        # Copy quiz JSON to public so React frontend can access it
-        shutil.copy(json_output_path, public_json_path)
-    
+        # A re-upload of an edited PDF reuses whatever did not change since the last version
+        previous = store.latest_quiz_id(pdf_filename, exclude=key)
+        job_id = jobs.submit(key, cache, store, filename=pdf_filename, previous=previous, trace_id=g.trace_id,
+                             prepare=move_into_cache)
+        UPLOADS.inc(result='queued')
+    except QueueFullError as e:
+        limiter.refund(client, cost)
+        UPLOADS.inc(result='busy')
+        if e.retry_after is None:
+            return jsonify({'message': 'Server is shutting down, please try again shortly'}), 503
+        return retry_later('Server is busy, please try again shortly', e.retry_after)
     except Exception as e:
-        return jsonify({'message': f'Upload succeeded, but processing failed: {str(e)}'}), 500
+        limiter.refund(client, cost)
+        UPLOADS.inc(result='failed')
+        log_event('upload_failed', g.trace_id, exc_info=True, error=str(e))
+        return jsonify({'message': f'Upload failed: {str(e)}'}), 500
 
     return jsonify({
-        'message': 'Upload and quiz generation complete!',
-        'quiz_url': f'/uploads/{base_name}_quiz.json',
-        'quiz_csv': f'/uploads/{base_name}_quiz.csv',
-        'num_chunks': len(quiz_data),
-        'total_questions': sum(len(chunk["questions"]) for chunk in quiz_data)
-    })  
+        'message': 'Upload received, generating quiz...',
+        'job_id': job_id,
+        'status_url': f'/api/jobs/{job_id}',
+        'result_url': f'/api/jobs/{job_id}/result'
+    }), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = jobs.status(job_id)
+    if job is None:
+        return jsonify({'message': 'Unknown job'}), 404
+    return jsonify(job)
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = jobs.status(job_id)
+    if job is None:
+        return jsonify({'message': 'Unknown job'}), 404
+    if job['status'] == 'failed':
+        return jsonify({'message': f'Upload succeeded, but processing failed: {job["error"]}'}), 500
+    if job['status'] != 'done':
+        # Records reach quiz.jsonl as each chunk is generated; clients pass offset=<records received> to get only new ones
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        records = read_jsonl(os.path.join(cache.entry_dir(job['key']), FILE_NAMES['jsonl']), offset)
+        return jsonify({
+            'message': 'Quiz generation still in progress',
+            'stage': job['stage'],
+            'offset': offset,
+            'records': records,
+            'questions': sum(len(record['questions']) for record in records)
+        }), 202
+
+    return jsonify({'message': 'Upload and quiz generation complete!', **job['result']})
+
+@app.route('/api/quizzes/<quiz_id>', methods=['GET'])
+def get_quiz(quiz_id):
+    quiz = store.get_quiz(quiz_id)
+    if quiz is None:
+        return jsonify({'message': 'Unknown quiz'}), 404
+
+    return conditional_json({
+        'id': quiz['id'],
+        'filename': quiz['filename'],
+        'created': quiz['created'],
+        'num_chunks': quiz['num_chunks'],
+        'total_questions': quiz['total_questions'],
+        'questions_url': f'/api/quizzes/{quiz_id}/questions'
+    }, quiz['etag'])
+
+@app.route('/api/quizzes/<quiz_id>/questions', methods=['GET'])
+def get_quiz_questions(quiz_id):
+    quiz = store.get_quiz(quiz_id)
+    if quiz is None:
+        return jsonify({'message': 'Unknown quiz'}), 404
+
+    # Clamped here rather than only in the store, so the response and ETag describe the page actually served
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', 10, type=int), 0), MAX_PAGE_SIZE)
+    questions = store.get_questions(quiz_id, offset, limit)
+
+    return conditional_json({
+        'quiz_id': quiz_id,
+        'offset': offset,
+        'limit': limit,
+        'total': quiz['total_questions'],
+        'questions': questions
+    }, f"{quiz['etag']}-{offset}-{limit}")
+
+@app.route('/api/quizzes/<quiz_id>/export/<format>', methods=['GET'])
+def export_quiz(quiz_id, format):
+    # Quiz IDs are cache keys, so each quiz's files are in its cache entry
+    path = safe_join(cache.folder, quiz_id, FILE_NAMES[format]) if format in FILE_NAMES else None
+    if path is None or not os.path.isfile(path):
+        return jsonify({'message': 'Unknown quiz or export format'}), 404
+    return send_file(os.path.abspath(path), mimetype=MIME_TYPES[format], conditional=True)
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve_react_app(path):
-    if path != "" and os.path.exists(os.path.join(app.static_folder, path)):
-        return send_from_directory(app.static_folder, path)
-    else:
-        return send_from_directory(app.static_folder, 'index.html')
+    # Anything that is not a built file is a client-side route of the React app
+    asset = assets.get(path) or assets.get('index.html')
+    if asset is None:
+        return jsonify({'message': 'The frontend has not been built (run npm run build)'}), 404
+    return asset.response()
 
 @app.errorhandler(404)
 def not_found(e):
-    return send_from_directory(app.static_folder, 'index.html')
+    return serve_react_app('index.html')
 
 if __name__ == '__main__':
-  app.run(debug=True, port=3000, host='0.0.0.0')
\ No newline at end of file
+  # Development server; production runs under gunicorn, see gunicorn.conf.py
+  assets.rescan = True
+  app.run(debug=True, port=3000, host='0.0.0.0')
@@ -0,0 +1,72 @@
+import os
+import re
+import sys
+import time
+import argparse
+import subprocess
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# What each target runs in a fresh interpreter
+TARGETS = {
+    'server': 'import server',
+    'wsgi': 'import wsgi; wsgi.create_app()',  # what a gunicorn master loads, warm-up included
+    'pipeline': 'import pipeline, pdf_text',  # what a pipeline pool worker needs
+}
+
+IMPORT_TIME_REGEX = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def profile(target, env=None):
+    """Run target under -X importtime; returns the wall time and (module, depth, self, cumulative) rows"""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', TARGETS[target]],
+        cwd=API_DIR, capture_output=True, text=True, env=env
+    )
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"{target} failed to start:\n{result.stderr[-2000:]}")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_REGEX.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            # -X importtime indents nested imports by two spaces per level
+            rows.append((module, (len(indent) - 1) // 2, int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return elapsed, rows
+
+
+def by_package(rows):
+    """Import time spent in each top-level package's own modules, slowest first; these add up to the total"""
+    packages = {}
+    for module, _, own, _ in rows:
+        package = module.split('.')[0]
+        packages[package] = packages.get(package, 0) + own
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report where server start-up time goes')
+    parser.add_argument('target', nargs='?', default='server', choices=sorted(TARGETS))
+    parser.add_argument('--top', type=int, default=15, help='packages to list')
+    parser.add_argument('--modules', action='store_true', help='list the slowest single modules instead of packages')
+    args = parser.parse_args()
+
+    elapsed, rows = profile(args.target)
+    imports = sum(cumulative for _, depth, _, cumulative in rows if depth == 0)
+    print(f"{args.target}: {elapsed * 1000:.0f} ms to start, {imports * 1000:.0f} ms of it importing "
+          f"{len(rows)} modules")
+
+    if args.modules:
+        slowest = sorted(((module, own) for module, _, own, _ in rows), key=lambda item: item[1], reverse=True)
+    else:
+        slowest = by_package(rows)
+    for name, seconds in slowest[:args.top]:
+        print(f"  {seconds * 1000:8.1f} ms  {name}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,116 @@
+import os
+import gzip
+import hashlib
+import mimetypes
+import threading
+
+from flask import Response, request, send_file
+
+try:
+    import brotli  # optional: only gzip variants are built without it
+except ImportError:
+    brotli = None
+
+# Vite puts content-hashed bundles here, so they never change under the same URL
+IMMUTABLE_PREFIX = 'assets/'
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'no-cache'
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml', 'application/xml')
+MIN_COMPRESS_BYTES = 1024
+MAX_MEMORY_BYTES = 4 * 1024 * 1024  # larger files are streamed from disk
+
+
+class StaticAsset:
+    def __init__(self, rel_path, abs_path):
+        self.path = abs_path
+        self.mimetype = mimetypes.guess_type(rel_path)[0] or 'application/octet-stream'
+        self.cache_control = IMMUTABLE_CACHE if rel_path.startswith(IMMUTABLE_PREFIX) else REVALIDATE_CACHE
+        self.size = os.path.getsize(abs_path)
+        self.data = None
+        self.variants = {}
+
+        if self.size > MAX_MEMORY_BYTES:
+            stat = os.stat(abs_path)
+            self.etag = hashlib.sha256(f"{rel_path}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()[:32]
+            return
+
+        with open(abs_path, 'rb') as f:
+            self.data = f.read()
+        self.etag = hashlib.sha256(self.data).hexdigest()[:32]
+
+        # Compressed once here at the highest level, instead of per request
+        if self.size >= MIN_COMPRESS_BYTES and self.mimetype.startswith(COMPRESSIBLE_TYPES):
+            if brotli is not None:
+                self.add_variant('br', brotli.compress(self.data, quality=11))
+            self.add_variant('gzip', gzip.compress(self.data, compresslevel=9, mtime=0))
+
+    def add_variant(self, encoding, data):
+        if len(data) < self.size:
+            self.variants[encoding] = data
+
+    def response(self):
+        if self.data is None:
+            response = send_file(self.path, mimetype=self.mimetype, conditional=True, etag=self.etag)
+        else:
+            accepted = request.accept_encodings
+            encoding = next((name for name in ('br', 'gzip') if name in self.variants and accepted[name]), None)
+            data = self.variants[encoding] if encoding else self.data
+            response = Response(data, mimetype=self.mimetype)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+            if self.variants:
+                response.vary.add('Accept-Encoding')
+            # Each encoding is a different representation, so it gets its own ETag
+            response.set_etag(f"{self.etag}-{encoding}" if encoding else self.etag)
+            response.make_conditional(request)
+
+        response.headers['Cache-Control'] = self.cache_control
+        return response
+
+
+class StaticAssets:
+    """In-memory index of the built React app, with precompressed variants of each file
+
+    The folder is scanned once, on first use, so requests never touch the
+    filesystem to find a file. With rescan=True (the dev server) a missing
+    path scans the folder again only if its mtime changed since the last
+    scan, as a new build does, so client-side routes do not recompress the
+    whole build on every request.
+    """
+
+    def __init__(self, folder, rescan=False):
+        self.folder = folder
+        self.rescan = rescan
+        self.files = None
+        self.scanned_mtime = None
+        self.lock = threading.Lock()
+
+    def folder_mtime(self):
+        try:
+            return os.stat(self.folder).st_mtime_ns
+        except OSError:
+            return None
+
+    def scan(self):
+        self.scanned_mtime = self.folder_mtime()
+        files = {}
+        for root, _, names in os.walk(self.folder):
+            for name in names:
+                abs_path = os.path.join(root, name)
+                rel_path = os.path.relpath(abs_path, self.folder).replace(os.sep, '/')
+                files[rel_path] = StaticAsset(rel_path, abs_path)
+        self.files = files
+
+    def get(self, path):
+        if self.files is None:
+            with self.lock:
+                if self.files is None:
+                    self.scan()
+        asset = self.files.get(path)
+        if asset is None and self.rescan and self.folder_mtime() != self.scanned_mtime:
+            with self.lock:
+                if self.folder_mtime() != self.scanned_mtime:
+                    self.scan()
+            asset = self.files.get(path)
+        return asset
@@ -0,0 +1,250 @@
+import os
+import re
+import time
+import queue
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from quizGeneration import RobustQuizGenerator
+
+# Fine-tuned model written by trainModel.py; falls back to the base model it was trained from
+MODEL_PATH = os.environ.get('T5_MODEL_PATH', 'models/slide2quiz-model')
+FALLBACK_MODEL = 't5-small'
+
+MAX_BATCH_SIZE = int(os.environ.get('T5_MAX_BATCH_SIZE', 8))
+MAX_WAIT_MS = float(os.environ.get('T5_MAX_WAIT_MS', 10))
+TORCH_THREADS = int(os.environ.get('T5_TORCH_THREADS', 0))  # 0 keeps torch's default
+CACHE_SIZE = int(os.environ.get('T5_CACHE_SIZE', 4096))
+
+MAX_INPUT_TOKENS = 512
+MAX_NEW_TOKENS = 64
+PROMPT_PREFIX = "Generate a quiz question and answer: "
+
+ANSWER_SPLIT_REGEX = re.compile(r'\banswer\s*:', re.IGNORECASE)
+QUESTION_PREFIX_REGEX = re.compile(r'^\s*question\s*:\s*', re.IGNORECASE)
+
+
+class T5Model:
+    """Tokenizer and model loaded once, generating for a whole batch of chunks at a time"""
+
+    def __init__(self, model_path=None):
+        try:
+            import torch
+            from transformers import AutoTokenizer, T5ForConditionalGeneration
+        except ImportError as e:
+            raise ImportError("The T5 backend needs torch and transformers installed") from e
+
+        if model_path is None:
+            model_path = MODEL_PATH if os.path.isdir(MODEL_PATH) else FALLBACK_MODEL
+        if TORCH_THREADS:
+            torch.set_num_threads(TORCH_THREADS)
+
+        self.torch = torch
+        self.model_path = model_path
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.model = T5ForConditionalGeneration.from_pretrained(model_path)
+        self.model.eval()
+
+    def generate(self, texts: List[str]) -> List[str]:
+        # Pad to the longest input in this batch rather than a fixed 512 tokens
+        inputs = self.tokenizer(
+            [PROMPT_PREFIX + text for text in texts],
+            padding='longest',
+            truncation=True,
+            max_length=MAX_INPUT_TOKENS,
+            return_tensors='pt'
+        )
+        with self.torch.inference_mode():
+            output_ids = self.model.generate(**inputs, max_new_tokens=MAX_NEW_TOKENS)
+        return self.tokenizer.batch_decode(output_ids, skip_special_tokens=True)
+
+
+class MicroBatcher:
+    """Collects single generation requests from any thread into batches
+
+    A batch is run as soon as it holds max_batch_size requests, or max_wait_ms
+    after its first request arrived, whichever comes first.
+    """
+
+    def __init__(self, run_batch, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self._loop, name='t5-batcher', daemon=True)
+        self.thread.start()
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        self.requests.put((text, future))
+        return future
+
+    def _loop(self):
+        while True:
+            batch = [self.requests.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            try:
+                outputs = self.run_batch([text for text, _ in batch])
+                for (_, future), output in zip(batch, outputs):
+                    future.set_result(output)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+
+class GenerationCache:
+    """LRU of generations keyed by a hash of the chunk text and model"""
+
+    def __init__(self, max_entries=CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def key(self, model_path, text):
+        return hashlib.sha256(f"{model_path}\0{MAX_NEW_TOKENS}\0{text}".encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def load_model(model_path=None) -> T5Model:
+    """The model for model_path, loaded once per process
+
+    Unlike the backend, the model survives a fork, so one loaded before the
+    server forks (see wsgi.warm_up) is shared copy-on-write by every worker.
+    """
+    with _models_lock:
+        if model_path not in _models:
+            _models[model_path] = T5Model(model_path)
+        return _models[model_path]
+
+
+class T5Backend:
+    def __init__(self, model_path=None):
+        self.model = load_model(model_path)
+        self.batcher = MicroBatcher(self.model.generate)
+        self.cache = GenerationCache()
+        self.pid = os.getpid()
+
+    def submit(self, text: str) -> Future:
+        """Future for the generation of one chunk, served from the cache when possible"""
+        key = self.cache.key(self.model.model_path, text)
+        cached = self.cache.get(key)
+        if cached is not None:
+            future = Future()
+            future.set_result(cached)
+            return future
+
+        def remember(done):
+            if done.exception() is None:
+                self.cache.put(key, done.result())
+
+        future = self.batcher.submit(text)
+        future.add_done_callback(remember)
+        return future
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend(model_path=None) -> T5Backend:
+    """The T5 backend of this worker process, loaded on first use"""
+    global _backend
+    with _backend_lock:
+        # The batcher thread does not survive a fork, so forked workers start their own
+        if _backend is None or _backend.pid != os.getpid():
+            _backend = T5Backend(model_path)
+        return _backend
+
+
+def parse_generation(text: str) -> Tuple[str, str]:
+    """Split model output like 'question: ... answer: ...' into its parts"""
+    parts = ANSWER_SPLIT_REGEX.split(text, maxsplit=1)
+    question = QUESTION_PREFIX_REGEX.sub('', parts[0]).strip()
+    answer = parts[1].strip() if len(parts) > 1 else ''
+    return question, answer
+
+
+class T5QuizGenerator(RobustQuizGenerator):
+    """Quiz generator backed by the fine-tuned slide2quiz T5 model
+
+    Chunks are cleaned and filtered exactly like the regex generator, then sent
+    to the shared micro-batcher so neighbouring chunks are generated together.
+    """
+
+    def __init__(self, model_path=None, window=MAX_BATCH_SIZE * 4):
+        super().__init__()
+        self.model_path = model_path
+        self.window = window
+
+    def warm_up(self):
+        load_model(self.model_path)
+
+    def generate_questions(self, text: str, terms: List[str] = None) -> List[Dict[str, str]]:
+        # The model picks what to ask about itself, so terms are not used
+        if not text:
+            return []
+        return self._questions(get_backend(self.model_path).submit(text).result())
+
+    def _questions(self, output: str) -> List[Dict[str, str]]:
+        question, answer = parse_generation(output)
+        if not question:
+            return []
+        return [{"question": question, "answer": answer, "term": ""}]
+
+    def process_pieces(self, pieces: Iterable[Tuple[int, str]], workers: int = None,
+                       batch_size: int = None) -> Iterator[Dict[str, any]]:
+        """Yield quiz records in order, keeping a window of chunks in flight so they batch up"""
+        backend = get_backend(self.model_path)
+        in_flight = []
+
+        def flush(limit):
+            while len(in_flight) > limit:
+                idx, chunk, future = in_flight.pop(0)
+                try:
+                    questions = self._questions(future.result())
+                except Exception as e:
+                    print(f"Error processing chunk {idx + 1}: {str(e)}")
+                    continue
+                if questions:
+                    yield {
+                        "chunk_number": idx + 1,
+                        "text_preview": chunk[:200] + ("..." if len(chunk) > 200 else ""),
+                        "questions": questions
+                    }
+
+        for idx, piece in pieces:
+            chunk = self.clean_text(piece.strip())
+            if not chunk or len(chunk) < 100:
+                continue
+            in_flight.append((idx, chunk, backend.submit(chunk)))
+            yield from flush(self.window)
+        yield from flush(0)
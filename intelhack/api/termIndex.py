@@ -0,0 +1,131 @@
+import re
+from typing import Dict, List
+
+import numpy as np
+
+MAX_TERM_WORDS = 3  # extract_meaningful_terms never keeps longer terms
+
+# Words, plus every other non-space character as a token of its own so n-grams never span punctuation
+TOKEN_REGEX = re.compile(r"[a-z]+|[^a-z\s]")
+
+
+def normalize_term(term: str) -> str:
+    return ' '.join(term.lower().split())
+
+
+class TermIndex:
+    """Sparse term-document matrix over the chunks of one document, for TF-IDF term ranking
+
+    Columns are the candidate terms found in any chunk (lowercased), rows are
+    the chunks. Each term is encoded as one integer from the IDs of its words,
+    so counting every term in every chunk is a single searchsorted over the
+    document's 1-3 word n-grams, and the matrix is kept as sorted (row, column)
+    cell keys with their counts rather than as a dense array.
+
+    A term scores tf * idf in a chunk, so terms that appear in most chunks of
+    the document (running headers, the subject's name) rank below terms
+    particular to the chunk.
+    """
+
+    def __init__(self, texts: List[str], candidates: List[Dict[str, int]]):
+        """texts are the cleaned chunks, candidates the term_candidates of each"""
+        self.num_rows = len(texts)
+        columns = {}
+        self.forms = []  # candidate (row, column) pairs keep the term as written in that chunk
+        rows, cols, order = [], [], []
+        for row, found in enumerate(candidates):
+            seen = set()
+            for position, term in enumerate(found):
+                col = columns.setdefault(normalize_term(term), len(columns))
+                if col in seen:
+                    continue  # "Cell" and "cell" in one chunk are one term, written as first found
+                seen.add(col)
+                rows.append(row)
+                cols.append(col)
+                order.append(position)
+                self.forms.append(term)
+
+        self.terms = list(columns)
+        self.pair_rows = np.array(rows, dtype=np.int64)
+        self.pair_cols = np.array(cols, dtype=np.int64)
+        self.pair_order = np.array(order, dtype=np.int64)
+
+        self.cells, self.counts = self._count(texts)
+        # Smoothed IDF, counting only chunks with any text as documents
+        num_docs = sum(1 for text in texts if text)
+        df = np.bincount(self.cells % max(len(self.terms), 1), minlength=len(self.terms))
+        self.idf = np.log((1 + num_docs) / (1 + df)) + 1
+
+    def _count(self, texts):
+        num_terms = len(self.terms)
+        if not num_terms:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        word_ids = {}
+        term_words = [[word_ids.setdefault(word, len(word_ids) + 1) for word in term.split()] for term in self.terms]
+        base = len(word_ids) + 1
+        term_keys = np.zeros(num_terms, dtype=np.int64)
+        for col, ids in enumerate(term_words):
+            for word_id in ids:
+                term_keys[col] = term_keys[col] * base + word_id
+
+        # Word IDs of the whole document, 0 for words in no term and between chunks
+        token_ids = []
+        token_rows = []
+        for row, text in enumerate(texts):
+            ids = [word_ids.get(token, 0) for token in TOKEN_REGEX.findall(text.lower())]
+            ids.append(0)
+            token_ids.extend(ids)
+            token_rows.extend([row] * len(ids))
+        token_ids = np.array(token_ids, dtype=np.int64)
+        token_rows = np.array(token_rows, dtype=np.int64)
+
+        # Every n-gram made only of term words, encoded like the terms; word IDs
+        # start at 1, so n-grams of different lengths never share a key
+        gram_keys = []
+        gram_rows = []
+        for n in range(1, MAX_TERM_WORDS + 1):
+            length = len(token_ids) - n + 1
+            if length <= 0:
+                break
+            keys = np.zeros(length, dtype=np.int64)
+            valid = np.ones(length, dtype=bool)
+            for i in range(n):
+                part = token_ids[i:i + length]
+                keys = keys * base + part
+                valid &= part > 0
+            gram_keys.append(keys[valid])
+            gram_rows.append(token_rows[:length][valid])
+        gram_keys = np.concatenate(gram_keys)
+        gram_rows = np.concatenate(gram_rows)
+
+        by_key = np.argsort(term_keys)
+        sorted_keys = term_keys[by_key]
+        found = np.minimum(np.searchsorted(sorted_keys, gram_keys), num_terms - 1)
+        hits = sorted_keys[found] == gram_keys
+        cells = gram_rows[hits] * num_terms + by_key[found[hits]]
+        return np.unique(cells, return_counts=True)
+
+    def scores(self) -> np.ndarray:
+        """TF-IDF of every candidate (row, column) pair"""
+        num_terms = max(len(self.terms), 1)
+        pair_cells = self.pair_rows * num_terms + self.pair_cols
+        found = np.minimum(np.searchsorted(self.cells, pair_cells), max(len(self.cells) - 1, 0))
+        tf = np.ones(len(pair_cells), dtype=np.int64)
+        if len(self.cells):
+            hits = self.cells[found] == pair_cells
+            tf[hits] = self.counts[found[hits]]
+        # A candidate is always in its own chunk, even where the tokenizer splits it differently
+        return tf * self.idf[self.pair_cols]
+
+    def top_terms(self, k: int = 5) -> List[List[str]]:
+        """The k best scoring candidates of every chunk, ties broken by order of appearance"""
+        top = [[] for _ in range(self.num_rows)]
+        if not len(self.pair_rows):
+            return top
+        ranked = np.lexsort((self.pair_order, -self.scores(), self.pair_rows))
+        ranked_rows = self.pair_rows[ranked]
+        rank = np.arange(len(ranked)) - np.searchsorted(ranked_rows, ranked_rows)
+        for pair in ranked[rank < k]:
+            top[self.pair_rows[pair]].append(self.forms[pair])
+        return top
@@ -1,4 +1,25 @@
+import os
 import re
+import hashlib
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, chain, islice
+
+# Bump whenever chunking output changes so cached results are invalidated
+CHUNKER_VERSION = 2
+
+# Chunker used by the upload pipeline: 'words' (iter_chunks) or 'tokens' (iter_token_chunks)
+CHUNKER_ENGINE = os.environ.get('CHUNKER_ENGINE', 'words')
+
+# Token chunks fit the T5 input window (512) with room left for the prompt
+MAX_CHUNK_TOKENS = 480
+CHUNK_OVERLAP = 0.15
+
+WORD_REGEX = re.compile(r'\S+')
+SENTENCE_END_REGEX = re.compile(r'[.!?]["\')\]”’]*(?=\s|$)')
+
+# Strength of the boundary after a word; chunks are cut at the strongest one available
+WORD_BOUNDARY, SENTENCE_BOUNDARY, SECTION_BOUNDARY, PAGE_BOUNDARY = 1, 2, 3, 4
 
 def remove_sections(text, keywords=['table of contents', 'bibliography', 'references']):
     for kw in keywords:
@@ -13,18 +34,27 @@ def normalize_text(text):
     return text
 
 def adaptive_chunk_size(text, base_chunk=300, max_chunk=2000):
-    word_count = len(text.split())
+    return chunk_size_for_word_count(len(text.split()), base_chunk, max_chunk)
+
+def chunk_size_for_word_count(word_count, base_chunk=300, max_chunk=2000):
     scale_factor = min((word_count / 2000), (max_chunk / base_chunk))
     return int(base_chunk * scale_factor)
 
+def chunk_size_is_final(word_count, base_chunk=300, max_chunk=2000):
+    # Past this point more words no longer change the adaptive chunk size
+    return word_count / 2000 >= max_chunk / base_chunk
+
 def chunk_text(text, chunk_size=500, overlap=20):
     words = text.split()
     chunks = []
+    # Very short texts get an adaptive chunk size of 0; never step by less than one word
+    chunk_size = max(chunk_size, 1)
+    step = max(chunk_size - overlap, 1)
     i = 0
     while i < len(words):
         chunk = words[i:i + chunk_size]
         chunks.append(' '.join(chunk))
-        i += chunk_size - overlap
+        i += step
     return chunks
 
 def process_text_and_chunk(text_path, output_path):
@@ -49,4 +79,215 @@ def process_text_and_chunk(text_path, output_path):
             f.write(f"\n--- Chunk {i + 1} ---\n")
             f.write(chunk + '\n')
 
-    print(f"[✓] Saved {len(all_chunks)} chunks to {output_path}")
\ No newline at end of file
+    print(f"[✓] Saved {len(all_chunks)} chunks to {output_path}")
+
+def iter_page_sections(pages, keywords=['table of contents', 'bibliography', 'references']):
+    """Yield the list of normalized sections of each page in a stream of page texts
+
+    Reading stops at the first excluded section keyword.
+    """
+    for page in pages:
+        idx = -1
+        page_lower = page.lower()
+        for kw in keywords:
+            found = page_lower.find(kw)
+            if found != -1 and (idx == -1 or found < idx):
+                idx = found
+        if idx != -1:
+            page = page[:idx]
+
+        yield [normalize_text(section).strip() for section in re.split(r'\n{2,}', page)]
+
+        if idx != -1:
+            return
+
+def iter_sections(pages, keywords=['table of contents', 'bibliography', 'references']):
+    """Yield normalized sections from a stream of page texts
+
+    Pages are joined the same way extract_text_and_note_images writes them, so
+    this yields the same sections process_text_and_chunk would split out of the
+    text file. Reading stops at the first excluded section keyword.
+    """
+    for sections in iter_page_sections(pages, keywords):
+        yield from sections
+
+def iter_chunks(pages, chunk_size=None, memo=None):
+    """Chunk a stream of page texts, yielding chunks as soon as they are ready
+
+    Without an explicit chunk_size, sections are buffered only until the
+    adaptive chunk size stops growing (or the document ends), so output
+    matches process_text_and_chunk while memory stays bounded.
+
+    memo maps section hashes (which include the chunk size) to their chunks
+    from an earlier run; only sections missing from it are re-chunked, and
+    afterwards it holds exactly the sections of this run.
+    """
+    sections = iter_sections(pages)
+
+    if chunk_size is None:
+        buffered = []
+        word_count = 0
+        for section in sections:
+            buffered.append(section)
+            word_count += len(section.split())
+            if chunk_size_is_final(word_count):
+                break
+        chunk_size = min(chunk_size_for_word_count(word_count), 2000)
+        sections = chain(buffered, sections)
+
+    overlap = int(chunk_size * 0.15)
+    if memo is None:
+        for section in sections:
+            if len(section.split()) > 50:
+                yield from chunk_text(section, chunk_size=chunk_size, overlap=overlap)
+        return
+
+    previous = dict(memo)
+    memo.clear()
+    for section in sections:
+        if len(section.split()) > 50:
+            key = hashlib.sha256(f"{chunk_size}\0{section}".encode('utf-8')).hexdigest()
+            chunks = previous.get(key)
+            if chunks is None:
+                chunks = chunk_text(section, chunk_size=chunk_size, overlap=overlap)
+            memo[key] = chunks
+            yield from chunks
+
+# Punctuation that usually sits against a word without changing how the word itself is split
+EDGE_PUNCTUATION = '.,;:!?\'"()[]“”‘’'
+
+def estimate_tokens(word):
+    """Tokens T5's SentencePiece vocabulary is likely to split a word into
+
+    A word of letters takes about one token per four characters. That is an
+    estimate, not a bound; the room MAX_CHUNK_TOKENS leaves in the model's
+    512-token window next to the prompt absorbs the odd rare word. Digits,
+    symbols and formulas are often split a character at a time, so any other
+    word counts one token per character plus one for the word-start marker,
+    which no split can exceed.
+    """
+    core = word.strip(EDGE_PUNCTUATION)
+    if core.isalpha():
+        return 1 + len(core) // 4 + len(word) - len(core)
+    return 1 + len(word)
+
+class TokenChunker:
+    """Chunker that sizes chunks in model tokens and cuts them at natural boundaries
+
+    Sections are appended to one text buffer and tokenized once into parallel
+    arrays of word offsets, cumulative token counts and the strength of the
+    boundary after each word. A chunk is a single slice of the buffer holding
+    at most max_tokens tokens, cut at the strongest boundary (page, section,
+    sentence, word) after min_tokens. The next chunk starts at the first
+    sentence boundary inside the overlap window, so small sections are merged
+    into their neighbours instead of being dropped. Emitted text is dropped
+    from the buffer, so memory stays bounded by about one chunk plus a page.
+    """
+
+    def __init__(self, max_tokens=MAX_CHUNK_TOKENS, overlap=CHUNK_OVERLAP, min_tokens=None):
+        self.max_tokens = max_tokens
+        self.min_tokens = min_tokens if min_tokens is not None else max_tokens // 2
+        self.overlap_tokens = min(int(max_tokens * overlap), self.min_tokens - 1)
+        self.text = ''
+        self.offset = 0                    # absolute position of text[0]
+        self.starts = array('l')
+        self.ends = array('l')
+        self.cumulative = array('l', [0])  # tokens before word i
+        self.boundaries = bytearray()      # boundary strength after word i
+
+    def add_section(self, section):
+        if self.text:
+            self.text += '\n'
+        offset = self.offset + len(self.text)
+        self.text += section
+
+        # One regex pass each for words and sentence ends, then bulk appends
+        spans = [match.span() for match in WORD_REGEX.finditer(section)]
+        sentence_ends = {match.end() for match in SENTENCE_END_REGEX.finditer(section)}
+        self.starts.extend([offset + start for start, _ in spans])
+        self.ends.extend([offset + end for _, end in spans])
+        self.cumulative.extend(islice(accumulate([estimate_tokens(section[start:end]) for start, end in spans],
+                                                 initial=self.cumulative[-1]), 1, None))
+        self.boundaries.extend([SENTENCE_BOUNDARY if end in sentence_ends else WORD_BOUNDARY for _, end in spans])
+        self.mark_boundary(SECTION_BOUNDARY)
+
+    def mark_boundary(self, strength):
+        if self.boundaries and self.boundaries[-1] < strength:
+            self.boundaries[-1] = strength
+
+    def chunks(self, final=False):
+        """Yield every chunk that is ready; with final=True, flush the rest of the buffer"""
+        while self.starts:
+            pending = self.cumulative[-1] - self.cumulative[0]
+            if not final and pending < self.max_tokens + self.min_tokens:
+                return
+            if pending <= self.max_tokens:
+                yield self.emit(len(self.starts) - 1, len(self.starts))
+                return
+            last = self.cut()
+            yield self.emit(last, self.next_start(last))
+
+    def cut(self):
+        """Index of the last word of the next chunk"""
+        cumulative = self.cumulative
+        base = cumulative[0]
+        # Word i ends the chunk with cumulative[i + 1] - base tokens
+        hi = bisect_right(cumulative, base + self.max_tokens) - 2
+        lo = bisect_left(cumulative, base + self.min_tokens) - 1
+        # Leave at least min_tokens behind so the tail is never a tiny chunk
+        hi_tail = bisect_right(cumulative, cumulative[-1] - self.min_tokens) - 2
+        if hi_tail >= lo:
+            hi = min(hi, hi_tail)
+        if hi < 0:
+            return 0  # a single word longer than max_tokens
+        lo = min(max(lo, 0), hi)
+
+        for strength in (PAGE_BOUNDARY, SECTION_BOUNDARY, SENTENCE_BOUNDARY):
+            found = self.boundaries.rfind(strength, lo, hi + 1)
+            if found != -1:
+                return found
+        return hi
+
+    def next_start(self, last):
+        """Index of the first word of the chunk after one ending at word last"""
+        if self.overlap_tokens <= 0:
+            return last + 1
+        cumulative = self.cumulative
+        earliest = max(bisect_left(cumulative, cumulative[last + 1] - self.overlap_tokens), 1)
+        if earliest > last:
+            return last + 1
+
+        starts = [self.boundaries.find(strength, earliest - 1, last)
+                  for strength in (SENTENCE_BOUNDARY, SECTION_BOUNDARY, PAGE_BOUNDARY)]
+        starts = [found + 1 for found in starts if found != -1]
+        return min(starts) if starts else earliest
+
+    def emit(self, last, next_start):
+        chunk = self.text[self.starts[0] - self.offset:self.ends[last] - self.offset]
+
+        if next_start >= len(self.starts):
+            self.text = ''
+            self.offset = 0
+            del self.starts[:], self.ends[:], self.boundaries[:]
+            self.cumulative = array('l', [0])
+            return chunk
+
+        # Offsets are absolute, so dropping emitted text only moves the buffer start
+        shift = self.starts[next_start] - self.offset
+        self.text = self.text[shift:]
+        self.offset += shift
+        del self.starts[:next_start], self.ends[:next_start], self.boundaries[:next_start]
+        del self.cumulative[:next_start]
+        return chunk
+
+def iter_token_chunks(pages, max_tokens=MAX_CHUNK_TOKENS, overlap=CHUNK_OVERLAP,
+                      keywords=['table of contents', 'bibliography', 'references']):
+    """Chunk a stream of page texts with TokenChunker, yielding chunks as soon as they are ready"""
+    chunker = TokenChunker(max_tokens=max_tokens, overlap=overlap)
+    for sections in iter_page_sections(pages, keywords):
+        for section in sections:
+            if section:
+                chunker.add_section(section)
+        chunker.mark_boundary(PAGE_BOUNDARY)
+        yield from chunker.chunks()
+    yield from chunker.chunks(final=True)
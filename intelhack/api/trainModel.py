@@ -1,80 +1,229 @@
-from transformers import T5Tokenizer, T5ForConditionalGeneration, Trainer, TrainingArguments
-from datasets import load_dataset
-import pandas as pd
-
-# === Load dataset using pandas to ensure proper parsing ===
-df = pd.read_csv("train.csv", delimiter=",")  # Use the correct delimiter
-print("Columns:", df.columns.tolist())  # Should print individual column names
-
-from datasets import Dataset
-dataset = Dataset.from_pandas(df)
-dataset = dataset.shuffle(seed=42).select(range(1000))
-
-# === Load tokenizer and model ===
-tokenizer = T5Tokenizer.from_pretrained("t5-small")
-model = T5ForConditionalGeneration.from_pretrained("t5-small")
-
-# === Preprocessing function ===
-def preprocess(example):
-    # Create input text
-    input_text = example["instruction"]
-    
-    # Handle responses
-    responses = example["responses"]
-    if pd.notna(responses) and responses != "[]":
-        try:
-            responses = eval(responses) if isinstance(responses, str) else responses
-            if isinstance(responses, list) and responses:
-                input_text += " Previous responses: " + " ".join(responses)
-        except:
-            pass
-    
-    # Tokenize
-    model_input = tokenizer(
-        input_text,
-        padding="max_length",
-        truncation=True,
-        max_length=512
+import os
+import ast
+import json
+import time
+import shutil
+import hashlib
+import argparse
+
+from datasets import Dataset, load_dataset, load_from_disk
+from transformers import (AutoTokenizer, T5ForConditionalGeneration, DataCollatorForSeq2Seq,
+                          Trainer, TrainerCallback, TrainingArguments)
+from transformers.trainer_utils import get_last_checkpoint
+
+# Tokenizing in several processes already spreads the work; stop the fast tokenizer forking threads too
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+TRAIN_CSV = "train.csv"
+BASE_MODEL = "t5-small"
+OUTPUT_DIR = "models/slide2quiz-model"  # read back by t5Inference.py
+TOKENIZED_CACHE = os.path.join("models", "tokenized")
+
+SAMPLE_SIZE = 1000
+SHUFFLE_BUFFER = 10_000
+MAX_INPUT_TOKENS = 512
+MAX_TARGET_TOKENS = 64
+CHECKPOINTS_PER_RUN = 4  # an interrupted run loses at most a quarter of its steps
+
+
+# === Preprocessing ===
+def parse_responses(responses):
+    """The responses column holds a Python list literal, or nothing"""
+    if not isinstance(responses, str) or responses in ("", "[]"):
+        return []
+    try:
+        parsed = ast.literal_eval(responses)
+    except (ValueError, SyntaxError):
+        return []
+    return [str(r) for r in parsed] if isinstance(parsed, list) else []
+
+
+def build_input(instruction, responses):
+    input_text = instruction or ""
+    previous = parse_responses(responses)
+    if previous:
+        input_text += " Previous responses: " + " ".join(previous)
+    return input_text
+
+
+def preprocess(batch, tokenizer):
+    """Tokenize a batch of rows without padding; the collator pads each training batch"""
+    inputs = [build_input(instruction, responses)
+              for instruction, responses in zip(batch["instruction"], batch["responses"])]
+    targets = [label or "" for label in batch["next_response"]]
+
+    model_input = tokenizer(inputs, truncation=True, max_length=MAX_INPUT_TOKENS)
+    labels = tokenizer(text_target=targets, truncation=True, max_length=MAX_TARGET_TOKENS)
+    model_input["labels"] = labels["input_ids"]
+    # Lets group_by_length sort batches without re-measuring every example
+    model_input["length"] = [len(ids) for ids in model_input["input_ids"]]
+    return model_input
+
+
+# === Dataset ===
+def stream_rows(csv_path, sample_size, seed):
+    """Stream rows from the CSV without loading it whole, shuffled through a bounded buffer"""
+    rows = load_dataset("csv", data_files=csv_path, split="train", streaming=True)
+    rows = rows.shuffle(seed=seed, buffer_size=SHUFFLE_BUFFER)
+    if sample_size:
+        rows = rows.take(sample_size)
+    for row in rows:
+        yield {
+            "instruction": row.get("instruction"),
+            "responses": row.get("responses"),
+            "next_response": row.get("next_response"),
+        }
+
+
+def cache_key(csv_path, tokenizer_name, sample_size, seed):
+    stat = os.stat(csv_path)
+    settings = [os.path.abspath(csv_path), stat.st_size, stat.st_mtime_ns, tokenizer_name,
+                sample_size, seed, MAX_INPUT_TOKENS, MAX_TARGET_TOKENS]
+    return hashlib.sha256(json.dumps(settings).encode("utf-8")).hexdigest()[:16]
+
+
+def load_tokenized(csv_path, tokenizer, tokenizer_name, sample_size, seed, num_proc, cache_dir=TOKENIZED_CACHE):
+    """Tokenized training set, read from disk when the CSV and settings have not changed"""
+    key = cache_key(csv_path, tokenizer_name, sample_size, seed)
+    path = os.path.join(cache_dir, key)
+    if os.path.isdir(path):
+        print(f"Loading tokenized dataset from {path}")
+        return load_from_disk(path)
+
+    started = time.perf_counter()
+    raw = Dataset.from_generator(
+        stream_rows,
+        gen_kwargs={"csv_path": csv_path, "sample_size": sample_size, "seed": seed},
+        # from_generator caches by the generator and its arguments alone, so a CSV edited
+        # in place would be read back from a shared raw cache; key it like the tokenized set
+        cache_dir=os.path.join(cache_dir, "raw", key)
     )
-    
-    label_text = example.get("next_response", "")
-    if label_text is None:
-        label_text = ""
-    label = tokenizer(
-        text_target=label_text,
-        padding="max_length",
-        truncation=True,
-        max_length=64
+    tokenized = raw.map(
+        preprocess,
+        batched=True,
+        batch_size=1000,
+        num_proc=num_proc if num_proc and num_proc > 1 and len(raw) >= num_proc else None,
+        fn_kwargs={"tokenizer": tokenizer},
+        remove_columns=raw.column_names,
+        desc="Tokenizing"
     )
-    model_input["labels"] = label["input_ids"]
-    return model_input
+    tokenized.save_to_disk(path)
+    print(f"Tokenized {len(tokenized)} examples in {time.perf_counter() - started:.1f}s, cached at {path}")
+    return load_from_disk(path)
+
+
+# === Throughput reporting ===
+class ThroughputCallback(TrainerCallback):
+    """Adds examples/sec since the previous log line to the training logs"""
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self.last_time = time.perf_counter()
+        self.last_step = state.global_step
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        if logs is None or "loss" not in logs:
+            return
+        now = time.perf_counter()
+        steps = state.global_step - self.last_step
+        if steps and now > self.last_time:
+            examples = steps * args.train_batch_size * args.gradient_accumulation_steps * args.world_size
+            logs["examples_per_sec"] = round(examples / (now - self.last_time), 2)
+        self.last_time = now
+        self.last_step = state.global_step
+
 
-# === Tokenize ===
-tokenized_dataset = dataset.map(
-    preprocess,
-    batched=True,                # Enable batching
-    batch_size=32,               # You can adjust this (e.g., 32 or 64)
-    remove_columns=dataset.column_names
-)
 # === Training ===
-training_args = TrainingArguments(
-    output_dir="models/slide2quiz-model",
-    num_train_epochs=1,
-    per_device_train_batch_size=8,
-    logging_steps=2,
-    save_strategy="epoch",
-    report_to="none"
-)
-
-trainer = Trainer(
-    model=model,
-    args=training_args,
-    train_dataset=tokenized_dataset,
-    tokenizer=tokenizer
-)
-
-trainer.train()
-trainer.save_model("models/slide2quiz-model")
-tokenizer.save_pretrained("models/slide2quiz-model")
-
-print("✅ Training complete")
\ No newline at end of file
+class LengthGroupedTrainer(Trainer):
+    """Trainer whose group_by_length sampler reads the precomputed length column
+
+    Trainer drops the columns forward() does not take, length among them,
+    before it builds the sampler, which would then re-measure every example.
+    The sampler is built from the full dataset instead; only its indices are used.
+    """
+
+    def _get_train_sampler(self, train_dataset=None):
+        return super()._get_train_sampler(self.train_dataset)
+
+
+def unfinished_checkpoint(checkpoint_dir):
+    """The last checkpoint of an interrupted run, or None if there is none or it reached the end"""
+    checkpoint = get_last_checkpoint(checkpoint_dir) if os.path.isdir(checkpoint_dir) else None
+    if checkpoint is None:
+        return None
+    with open(os.path.join(checkpoint, "trainer_state.json"), encoding="utf-8") as f:
+        state = json.load(f)
+    return checkpoint if state["global_step"] < state["max_steps"] else None
+
+
+def train(csv_path=TRAIN_CSV, base_model=BASE_MODEL, output_dir=OUTPUT_DIR, sample_size=SAMPLE_SIZE,
+          epochs=1, batch_size=8, num_proc=None, resume=True, seed=42, max_steps=-1):
+    tokenizer = AutoTokenizer.from_pretrained(base_model)
+    model = T5ForConditionalGeneration.from_pretrained(base_model)
+
+    tokenized_dataset = load_tokenized(csv_path, tokenizer, base_model, sample_size, seed,
+                                       num_proc or os.cpu_count())
+
+    checkpoint_dir = os.path.join(output_dir, "checkpoints")
+    training_args = TrainingArguments(
+        output_dir=checkpoint_dir,
+        num_train_epochs=epochs,
+        max_steps=max_steps,
+        per_device_train_batch_size=batch_size,
+        # Batches examples of similar length so each padded batch wastes little
+        train_sampling_strategy="group_by_length",
+        length_column_name="length",
+        logging_steps=2,
+        save_strategy="steps",
+        # A fraction of the run's total steps, so short runs checkpoint too
+        save_steps=1 / CHECKPOINTS_PER_RUN,
+        save_total_limit=2,
+        seed=seed,
+        report_to="none"
+    )
+
+    trainer = LengthGroupedTrainer(
+        model=model,
+        args=training_args,
+        train_dataset=tokenized_dataset,
+        # Pads inputs to the longest in each batch and labels with -100 so padding is not learned
+        data_collator=DataCollatorForSeq2Seq(tokenizer, model=model, pad_to_multiple_of=8),
+        processing_class=tokenizer,
+        callbacks=[ThroughputCallback()]
+    )
+
+    checkpoint = unfinished_checkpoint(checkpoint_dir) if resume else None
+    if checkpoint:
+        print(f"Resuming from {checkpoint}")
+
+    result = trainer.train(resume_from_checkpoint=checkpoint)
+    trainer.save_model(output_dir)
+    tokenizer.save_pretrained(output_dir)
+    # The model is saved, so the next run starts from the base model instead of resuming this one
+    shutil.rmtree(checkpoint_dir, ignore_errors=True)
+
+    print(f"Throughput: {result.metrics['train_samples_per_second']:.2f} examples/sec "
+          f"over {result.metrics['train_runtime']:.1f}s")
+    print(f"✅ Training complete after {result.global_step} steps")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fine-tune T5 on slide/quiz pairs")
+    parser.add_argument('--csv', default=TRAIN_CSV, help="training CSV with instruction, responses and next_response columns")
+    parser.add_argument('--base-model', default=BASE_MODEL)
+    parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    parser.add_argument('--sample-size', type=int, default=SAMPLE_SIZE, help="rows to train on, 0 for all")
+    parser.add_argument('--epochs', type=float, default=1)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--max-steps', type=int, default=-1, help="stop after this many steps (overrides --epochs)")
+    parser.add_argument('--num-proc', type=int, default=None, help="tokenization processes, defaults to one per core")
+    parser.add_argument('--no-resume', action='store_true', help="start fresh even if checkpoints exist")
+    args = parser.parse_args()
+
+    train(csv_path=args.csv, base_model=args.base_model, output_dir=args.output_dir,
+          sample_size=args.sample_size, epochs=args.epochs, batch_size=args.batch_size,
+          num_proc=args.num_proc, resume=not args.no_resume, max_steps=args.max_steps)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import os
+import uuid
+import hashlib
+
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import secure_filename
+
+# Uploads larger than this are rejected; requests announcing more are refused before the body is read
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_MB', 50)) * 1024 * 1024
+
+PDF_MAGIC = b'%PDF-'
+
+
+class HashingUploadFile:
+    """Writable spool file that hashes and size-checks an upload as it is parsed
+
+    Werkzeug's multipart parser writes the file part into this object block by
+    block, so the upload lands on disk once, already hashed, with no full copy
+    in memory.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.digest = hashlib.sha256()
+        self.file = open(path, 'w+b')
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_bytes and self.size > self.max_bytes:
+            raise RequestEntityTooLarge(f'Uploads are limited to {self.max_bytes // (1024 * 1024)} MB')
+        self.digest.update(data)
+        return self.file.write(data)
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
+
+    def looks_like_pdf(self):
+        self.file.seek(0)
+        header = self.file.read(len(PDF_MAGIC))
+        self.file.seek(0)
+        return header == PDF_MAGIC
+
+    def claim(self, dest_path):
+        """Move the spooled upload to its storage path"""
+        self.file.close()
+        os.replace(self.path, dest_path)
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+class StreamingUploadRequest(Request):
+    """Request that spools file uploads straight into UPLOAD_SPOOL_FOLDER while hashing them"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        folder = current_app.config['UPLOAD_SPOOL_FOLDER']
+        upload = HashingUploadFile(
+            os.path.join(folder, f"tmp-{uuid.uuid4().hex}.upload"),
+            current_app.config.get('MAX_CONTENT_LENGTH')
+        )
+        # Remembered here rather than read back from request.files, which is
+        # never populated if parsing fails part way through
+        self.__dict__.setdefault('spooled_uploads', []).append(upload)
+        return upload
+
+
+def storage_name(filename):
+    """Sanitized display name for an uploaded file; storage itself is keyed by content hash"""
+    return secure_filename(filename) or 'upload.pdf'
+
+
+def discard_spooled_files(request):
+    # Remove spool files of any upload that was not claimed by the handler
+    for upload in request.__dict__.get('spooled_uploads', []):
+        upload.discard()
@@ -0,0 +1,36 @@
+"""Production entry point: gunicorn -c gunicorn.conf.py 'wsgi:create_app()'"""
+import os
+import time
+
+# Load PyMuPDF, the question generator and any model in the master before gunicorn forks
+PRELOAD_PIPELINE = os.environ.get('PRELOAD_PIPELINE', '1') == '1'
+
+
+def warm_up():
+    """Import and load everything the first pipeline run would otherwise wait for
+
+    Run before the fork, so the workers and their pipeline pools share it
+    copy-on-write instead of each loading their own copy on first use.
+    """
+    import pdf_text  # PyMuPDF, which the server itself only imports on first use
+    from quizGeneration import make_generator, QUIZ_BACKEND, TERM_SCORING
+    from quizExport import load_formats, EXPORT_FORMATS
+
+    load_formats(EXPORT_FORMATS)
+    # re keeps compiled patterns in a module cache, so the generators each job
+    # builds find the term and sentence regexes already compiled
+    make_generator(QUIZ_BACKEND, TERM_SCORING).warm_up()
+
+
+def create_app():
+    """Load the app, and with PRELOAD_PIPELINE the pipeline too, before gunicorn forks its workers"""
+    started = time.perf_counter()
+    from server import app
+    from metrics import log_event
+    imported = time.perf_counter()
+
+    if PRELOAD_PIPELINE:
+        warm_up()
+    log_event('app_loaded', import_seconds=round(imported - started, 6),
+              warm_up_seconds=round(time.perf_counter() - imported, 6) if PRELOAD_PIPELINE else None)
+    return app
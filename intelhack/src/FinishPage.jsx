@@ -11,19 +11,20 @@ function FinishPage() {
   // Get current section from query param, default to 0
   const params = new URLSearchParams(location.search);
   const section = parseInt(params.get("section") || "0", 10);
+  const quizId = params.get("quiz") || localStorage.getItem("quizId");
 
   // Helper to get total number of questions (async)
   const getTotalQuestions = async () => {
-    const res = await fetch('/quizData.json');
+    const res = await fetch(`/api/quizzes/${quizId}`);
     const data = await res.json();
-    return data.flatMap(chunk => chunk.questions).length;
+    return data.total_questions;
   };
 
   const handleGenerate = async () => {
     const totalQuestions = await getTotalQuestions();
     const totalSections = Math.ceil(totalQuestions / 10);
     const nextSection = (section + 1) % totalSections;
-    navigate(`/questions?section=${nextSection}`);
+    navigate(`/questions?quiz=${quizId}&section=${nextSection}`);
   };
 
   const handleFileChange = (e) => {
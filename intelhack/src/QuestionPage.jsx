@@ -11,21 +11,19 @@ function QuestionPage({ section = 0 }) {
 
   const params = new URLSearchParams(location.search);
   const sectionParam = parseInt(params.get("section") || section, 10);
+  const quizId = params.get("quiz") || localStorage.getItem("quizId");
 
-  // Load JSON on mount
+  // Load only this section's questions on mount
   useEffect(() => {
-    fetch("/quizData.json")
+    fetch(`/api/quizzes/${quizId}/questions?offset=${sectionParam * 10}&limit=10`)
       .then((res) => res.json())
       .then((data) => {
-        const allQuestions = data.flatMap(chunk => chunk.questions);
-        const start = sectionParam * 10;
-        const end = start + 10;
-        setQuizData(allQuestions.slice(start, end));
+        setQuizData(data.questions || []);
         setCurrentIndex(0);
         setAnswer("");
         setFeedback("");
       });
-  }, [sectionParam]);
+  }, [quizId, sectionParam]);
 
   const handleSubmit = (e) => {
     e.preventDefault();
@@ -47,7 +45,7 @@ function QuestionPage({ section = 0 }) {
       setFeedback("");
     } else {
       // On last question, go to finish page
-      navigate(`/end?section=${sectionParam}`);
+      navigate(`/end?quiz=${quizId}&section=${sectionParam}`);
     }
   };
 
@@ -31,10 +31,35 @@ function UploadPage() {
       }
 
       const result = await response.json();
-      setStatus(result.message || 'Upload complete!');
+      setStatus(result.message || 'Upload received!');
+
+      // Poll the job until the pipeline finishes (cached uploads are already done)
+      while (!result.cached) {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        const jobResponse = await fetch(result.status_url);
+        const job = await jobResponse.json();
+
+        if (!jobResponse.ok || job.status === 'failed') {
+          setStatus(job.error ? `Processing failed: ${job.error}` : (job.message || 'Processing failed.'));
+          return;
+        }
+        if (job.status === 'done') {
+          break;
+        }
+        if (!job.stage) {
+          setStatus('Waiting in queue...');
+        } else {
+          setStatus(`Working on: ${job.stage}... (${job.progress.pages} pages, ${job.progress.questions} questions so far)`);
+        }
+      }
+
+      setStatus('Upload and quiz generation complete!');
+
+      const jobResult = result.cached ? result : await (await fetch(result.result_url)).json();
+      localStorage.setItem('quizId', jobResult.quiz_id);
 
       // Navigate to the question page after upload success
-      navigate('/questions');  // <-- change this to your actual QuestionPage route
+      navigate(`/questions?quiz=${jobResult.quiz_id}`);  // <-- change this to your actual QuestionPage route
 
     } catch (err) {
       setStatus('Upload failed (network error).');